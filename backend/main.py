@@ -1,51 +1,149 @@
+import asyncio
+import json
 import os
+from collections import deque
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from lark import UnexpectedInput
-from typing import List
-from presburger_converter import formula_to_aut
+from typing import List, Optional
+from presburger_converter.sessions import SessionStore
+from presburger_converter.incremental import SubformulaCache
+from presburger_converter.batch import BatchPlan
 
-from presburger_converter.solutions import find_example_solutions
-from presburger_converter.automaton.mata_io import nfa_to_mata, nfa_from_mata
+from presburger_converter.solutions import optimize
+from presburger_converter.automaton.mata_io import nfa_from_mata, nfa_from_bytes, nfa_to_mata
+from presburger_converter.automaton.budget import BudgetExceeded
+from presburger_converter.automaton.store import AutomatonStore
 from presburger_converter.viz import aut_to_dot
+from presburger_converter.workers import (
+    WorkerPool, PoolBusy, JobTimeout, JobCancelled, WorkerCrashed,
+    compile_job, build_job, solutions_job, dot_job,
+)
 
-app = FastAPI()
+# Compilation runs in a pool of worker processes so that one expensive
+# formula does not block the event loop.
+pool = WorkerPool(
+    workers=int(os.environ.get("PRESBURGER_WORKERS", "0")) or None,
+    max_queue=int(os.environ.get("PRESBURGER_QUEUE_MAX", "16")),
+)
+job_timeout = float(os.environ.get("PRESBURGER_TIMEOUT_S", "60"))
+
+def _env_limit(name, default, scale=1):
+    value = float(os.environ.get(name, default))
+    return int(value * scale) if value > 0 else None
+
+# Construction budget of one request.  The deadline lies a little before the
+# job timeout so that the worker can still report how far it got.
+construction_limits = {
+    "max_states": _env_limit("PRESBURGER_MAX_STATES", "200000"),
+    "max_transitions": _env_limit("PRESBURGER_MAX_TRANSITIONS", "5000000"),
+    "deadline_s": 0.9 * job_timeout,
+    "max_memory_bytes": _env_limit("PRESBURGER_MAX_MEMORY_MB", "2048", 2**20),
+}
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Optional persistent cache of compiled automata shared by all workers.
+_cache_dir = os.environ.get("PRESBURGER_CACHE_DIR")
+_cache_max_bytes = int(os.environ.get("PRESBURGER_CACHE_MAX_MB", "256")) * 2**20
+
+# Compiled automata of recent requests, addressed by the handle returned from
+# /automaton/dot, so follow-up requests need not ship the automaton back.
+# Larger automata are drawn as a summary unless a request sets full_dot.
+dot_max_states = int(os.environ.get("PRESBURGER_DOT_MAX_STATES", "500"))
+# Automata of subformulas kept per edited formula for incremental recompiles.
+subformula_max_bytes = int(os.environ.get("PRESBURGER_SUBFORMULA_CACHE_MB", "16")) * 2**20
+
+sessions = SessionStore(
+    max_sessions=int(os.environ.get("PRESBURGER_SESSIONS_MAX", "256")),
+    ttl=float(os.environ.get("PRESBURGER_SESSIONS_TTL", "1800")),
+)
 
 class FormulaRequest(BaseModel):
     formula: str
+    handle: Optional[str] = None      # session of the formula this one is an edit of
     display_labels: bool = True
     display_atomic_construction: bool = False
+    profile: bool = False
+    full_dot: bool = False
+    integers: bool = False
 
 class SolutionsRequest(BaseModel):
-    aut: str
+    handle: Optional[str] = None
+    aut: Optional[str] = None
     k_solutions: int
     original_variable_order: List[str]
     new_variable_order: List[str]
     display_atomic_construction: bool = False
     formula: str = None
+    integers: bool = False
 
 class ReorderRequest(BaseModel):
-    aut: str
+    handle: Optional[str] = None
+    aut: Optional[str] = None
     k_solutions: int
     original_variable_order: List[str]
     new_variable_order: List[str]
     display_labels: bool = True
     display_atomic_construction: bool = False
     formula: str = None
+    full_dot: bool = False
+    integers: bool = False
+
+class OptimizeRequest(BaseModel):
+    handle: Optional[str] = None
+    aut: Optional[str] = None
+    original_variable_order: List[str]
+    objective_var: str
+    direction: str = "min"
+    display_atomic_construction: bool = False
+    formula: str = None
+    integers: bool = False
+
+async def _subformulas(req):
+    """``(cache, reusable)`` for compiling ``req.formula``.
+
+    The cache is the one of the session ``req.handle`` if that formula is
+    being edited (a new one otherwise); *reusable* are its entries the new
+    formula can use, or ``None`` when the construction must not use them.
+    """
+    previous = sessions.get(req.handle) if req.handle else None
+    if (previous is not None and previous.subformulas is not None
+            and previous.integers == req.integers):
+        cache = previous.subformulas
+    else:
+        cache = SubformulaCache(subformula_max_bytes)
+    if req.display_atomic_construction:
+        return cache, None
+    return cache, await asyncio.to_thread(cache.reusable, req.formula, req.integers)
+
+def _dot_limit(req) -> Optional[int]:
+    """State count above which *req* gets the summarized graph."""
+    return None if req.full_dot else dot_max_states
+
+def _is_summary(num_states: int, max_states: Optional[int]) -> bool:
+    return max_states is not None and num_states > max_states
 
 @app.post("/automaton/dot")
-async def automaton_dot(req: FormulaRequest):
+async def automaton_dot(req: FormulaRequest, request: Request):
     formula = req.formula
     k_solutions = 9
+    subformulas, reusable = await _subformulas(req)
     try:
-        aut_minimized, aut, variable_order = formula_to_aut(formula, req.display_atomic_construction)
-        example_solutions = find_example_solutions(aut_minimized, k_solutions, variable_order)
-        dot_string = aut_to_dot(aut, variable_order, display_labels=req.display_labels, display_atomic_construction=req.display_atomic_construction)
-        mata_string = nfa_to_mata(aut)
-        num_states = len(aut.get_reachable_states())
-        num_final_states = len(aut.final_states)
+        result = await pool.run(
+            compile_job, formula, req.display_atomic_construction, req.display_labels,
+            k_solutions, req.profile, _cache_dir, _cache_max_bytes, construction_limits,
+            _dot_limit(req), req.integers, reusable,
+            timeout=job_timeout, is_disconnected=request.is_disconnected,
+        )
     except UnexpectedInput as exc:
         try:
             context = exc.get_context(formula)
@@ -62,83 +160,381 @@ async def automaton_dot(req: FormulaRequest):
             media_type="text/plain",
             status_code=400,
         )
+    except BudgetExceeded as exc:
+        return _budget_response(exc)
+    except (PoolBusy, JobTimeout, JobCancelled, WorkerCrashed) as exc:
+        return _pool_error_response(exc)
 
-    return JSONResponse(
-        content={
-            "dot": dot_string,
-            "variables": variable_order,
-            "example_solutions": example_solutions,
-            "mata": mata_string,
+    handle, session = _create_session(result, req.display_atomic_construction, formula,
+                                      req.integers, subformulas)
+    session.dot_cache[(None, req.display_labels, _dot_limit(req))] = result["dot"]
+
+    content = {
+        "handle": handle,
+        "dot": result["dot"],
+        "dot_summary": _is_summary(result["num_states"], _dot_limit(req)),
+        "variables": result["variables"],
+        "example_solutions": result["example_solutions"],
+        "mata": result["mata"],
+        "num_states": result["num_states"],
+        "num_final_states": result["num_final_states"],
+    }
+    trace = result["trace"]
+    if trace is not None:
+        content["trace"] = trace.to_dict()
+        content["trace_folded"] = trace.to_folded()
+    return JSONResponse(content=content)
+
+@app.post("/automaton/stream")
+async def automaton_stream(req: FormulaRequest, request: Request):
+    """Like /automaton/dot, but every part is sent as soon as it is ready.
+
+    The automaton is built before the response starts, so errors get the
+    same status codes as for /automaton/dot.  Then the events ``automaton``
+    (handle, variables, state counts), ``solutions``, ``mata`` and ``dot``
+    follow as NDJSON lines, or as server-sent events if the client accepts
+    ``text/event-stream``.  Stages still running when the client goes away
+    are abandoned.
+    """
+    formula = req.formula
+    k_solutions = 9
+    subformulas, reusable = await _subformulas(req)
+    try:
+        result = await pool.run(
+            build_job, formula, req.display_atomic_construction,
+            _cache_dir, _cache_max_bytes, construction_limits, req.integers, reusable,
+            timeout=job_timeout, is_disconnected=request.is_disconnected,
+        )
+    except UnexpectedInput as exc:
+        try:
+            context = exc.get_context(formula)
+        except Exception:
+            context = str(exc)
+        return Response(
+            content="Syntax error:\n" + context,
+            media_type="text/plain",
+            status_code=400,
+        )
+    except AssertionError as exc:
+        return Response(
+            content="Syntax error:\n" + str(exc),
+            media_type="text/plain",
+            status_code=400,
+        )
+    except BudgetExceeded as exc:
+        return _budget_response(exc)
+    except (PoolBusy, JobTimeout, JobCancelled, WorkerCrashed) as exc:
+        return _pool_error_response(exc)
+
+    handle, session = _create_session(result, req.display_atomic_construction, formula,
+                                      req.integers, subformulas)
+    variables = session.variables
+    aut_min = result["aut_min"] if result["aut_min"] is not None else result["aut"]
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    def event(name, content):
+        if sse:
+            return f"event: {name}\ndata: {json.dumps(content)}\n\n"
+        return json.dumps({"event": name, **content}) + "\n"
+
+    num_states = len(session.aut.get_reachable_states())
+
+    async def events():
+        yield event("automaton", {
+            "handle": handle,
+            "variables": variables,
             "num_states": num_states,
-            "num_final_states": num_final_states,
-        }
+            "num_final_states": len(session.aut.final_states),
+        })
+        try:
+            solutions = await pool.run(solutions_job, aut_min, k_solutions, variables,
+                                       req.integers, timeout=job_timeout)
+            yield event("solutions", {"example_solutions": solutions})
+            mata = await asyncio.to_thread(nfa_to_mata, session.aut)
+            yield event("mata", {"mata": mata})
+            dot = await pool.run(dot_job, result["aut"], variables, req.display_labels,
+                                 req.display_atomic_construction, _dot_limit(req),
+                                 timeout=job_timeout)
+            session.dot_cache[(None, req.display_labels, _dot_limit(req))] = dot
+            yield event("dot", {"dot": dot,
+                                "dot_summary": _is_summary(num_states, _dot_limit(req))})
+        except (PoolBusy, JobTimeout, WorkerCrashed) as exc:
+            yield event("error", {"error": _pool_error_response(exc).body.decode()})
+        except Exception as exc:
+            # The status line is already sent; without this event the client
+            # could not tell a failed stage from the end of the stream.
+            yield event("error", {"error": str(exc) or type(exc).__name__})
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+def _create_session(result, display_atomic_construction, formula, integers=False,
+                    subformulas=None):
+    """Register the automata of a compile/build job as a new session.
+
+    The subformula automata the job built are added to *subformulas*, which
+    the session keeps for the next edit.
+    """
+    aut = nfa_from_bytes(result["aut"])
+    aut_min = aut if result["aut_min"] is None else nfa_from_bytes(result["aut_min"])
+    if subformulas is not None:
+        subformulas.update(result["subformulas"])
+    return sessions.create(
+        aut_min, aut, result["variables"],
+        display_atomic_construction=display_atomic_construction,
+        formula=formula,
+        integers=integers,
+        subformulas=subformulas,
+    )
+
+
+def _budget_response(exc):
+    stats = exc.stats
+    content = (
+        f"The formula is too expensive: its {exc}.\n"
+        f"Aborted after {stats['elapsed_s']:.1f} s with up to "
+        f"{stats['peak_states']} states and {stats['peak_transitions']} transitions."
+    )
+    # Too large an automaton is a property of the formula; running out of
+    # time or memory may also be due to the load on the server.
+    status_code = 422 if exc.resource in ("states", "transitions") else 503
+    return Response(content=content, media_type="text/plain", status_code=status_code)
+
+
+def _pool_error_response(exc):
+    if isinstance(exc, PoolBusy):
+        return Response(
+            content="The server is busy, please try again shortly.",
+            media_type="text/plain",
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    if isinstance(exc, JobTimeout):
+        return Response(
+            content=f"Construction did not finish within {job_timeout:g} s.",
+            media_type="text/plain",
+            status_code=504,
+        )
+    if isinstance(exc, JobCancelled):
+        # Nobody is listening any more; nginx' "client closed request".
+        return Response(status_code=499)
+    return Response(
+        content="Construction failed, probably because it ran out of memory.",
+        media_type="text/plain",
+        status_code=503,
+    )
+
+async def _resolve_session(req, request):
+    """Return ``(handle, session)`` for a follow-up request.
+
+    Uses the session of ``req.handle`` if it is still alive, otherwise
+    rebuilds one from the automaton (or formula) sent along and returns a
+    new handle.  Returns ``(None, None)`` if neither is available.
+    """
+    session = sessions.get(req.handle)
+    if session is not None:
+        return req.handle, session
+    if req.display_atomic_construction:
+        if not req.formula:
+            return None, None
+        result = await pool.run(
+            build_job, req.formula, req.display_atomic_construction,
+            _cache_dir, _cache_max_bytes, construction_limits, req.integers,
+            timeout=job_timeout, is_disconnected=request.is_disconnected,
+        )
+        return _create_session(result, req.display_atomic_construction, req.formula,
+                               req.integers)
+    else:
+        if not req.aut:
+            return None, None
+        aut = await asyncio.to_thread(nfa_from_mata, req.aut)
+    return sessions.create(
+        aut, aut, req.original_variable_order,
+        display_atomic_construction=req.display_atomic_construction,
+        formula=req.formula,
+        integers=req.integers,
+    )
+
+
+def _expired_response():
+    return Response(
+        content="The automaton has expired on the server, please build it again.",
+        media_type="text/plain",
+        status_code=410,
     )
 
+
 @app.post("/automaton/solutions")
-async def automaton_solutions(req: SolutionsRequest):
+async def automaton_solutions(req: SolutionsRequest, request: Request):
     try:
-        if req.display_atomic_construction:
-            aut_minimized, aut, variable_order = formula_to_aut(req.formula, req.display_atomic_construction)
-        else:
-            aut = nfa_from_mata(req.aut)
-            aut_minimized = aut
-        example_solutions = find_example_solutions(
-            aut_minimized,
+        handle, session = await _resolve_session(req, request)
+        if session is None:
+            return _expired_response()
+        example_solutions = await asyncio.to_thread(
+            session.solutions,
             req.k_solutions,
-            req.original_variable_order,
-            req.new_variable_order if req.new_variable_order != req.original_variable_order else None
+            req.new_variable_order if req.new_variable_order != session.variables else None,
         )
         number_of_new_solutions = 5 - (req.k_solutions - len(example_solutions))
         if number_of_new_solutions <= 0:
             new_solutions = []
         else:
             new_solutions = example_solutions[-number_of_new_solutions:]
-    except (UnexpectedInput, AssertionError) as exc:
+    except (UnexpectedInput, AssertionError, ValueError) as exc:
         return Response(
             content=f"Syntax error:\n{str(exc)}",
             media_type="text/plain",
             status_code=400,
         )
+    except BudgetExceeded as exc:
+        return _budget_response(exc)
+    except (PoolBusy, JobTimeout, JobCancelled, WorkerCrashed) as exc:
+        return _pool_error_response(exc)
 
     return JSONResponse(
         content={
             "example_solutions": new_solutions,
             "solution_set_full": number_of_new_solutions != 5,
+            "handle": handle,
         }
     )
 
 
 @app.post("/automaton/reorder")
-async def automaton_reorder(req: ReorderRequest):
+async def automaton_reorder(req: ReorderRequest, request: Request):
     try:
-        if req.display_atomic_construction:
-            aut_minimized, aut, variable_order = formula_to_aut(req.formula, req.display_atomic_construction)
-        else:
-            aut = nfa_from_mata(req.aut)
-            aut_minimized = aut
-        example_solutions = find_example_solutions(
-            aut_minimized,
-            req.k_solutions,
-            req.original_variable_order,
-            req.new_variable_order
+        handle, session = await _resolve_session(req, request)
+        if session is None:
+            return _expired_response()
+        example_solutions = await asyncio.to_thread(
+            session.solutions, req.k_solutions, req.new_variable_order,
         )
-        dot_string = aut_to_dot(
-            aut,
-            req.original_variable_order,
-            req.new_variable_order,
-            req.display_labels,
-            req.display_atomic_construction
+        dot_string = await asyncio.to_thread(
+            session.dot, req.new_variable_order, req.display_labels, aut_to_dot,
+            _dot_limit(req),
         )
-    except (UnexpectedInput, AssertionError) as exc:
+        dot_summary = _is_summary(len(session.aut.get_reachable_states()), _dot_limit(req))
+    except (UnexpectedInput, AssertionError, ValueError) as exc:
         return Response(
             content=f"Syntax error:\n{str(exc)}",
             media_type="text/plain",
             status_code=400,
         )
+    except BudgetExceeded as exc:
+        return _budget_response(exc)
+    except (PoolBusy, JobTimeout, JobCancelled, WorkerCrashed) as exc:
+        return _pool_error_response(exc)
 
     return JSONResponse(
         content={
             "reordered_solutions": example_solutions,
             "dot": dot_string,
+            "dot_summary": dot_summary,
+            "handle": handle,
+        }
+    )
+
+
+@app.post("/automaton/optimize")
+async def automaton_optimize(req: OptimizeRequest, request: Request):
+    """Exact minimum or maximum of one variable, with a solution attaining it.
+
+    ``status`` is ``"optimal"``, ``"unbounded"`` or ``"infeasible"``.
+    """
+    try:
+        handle, session = await _resolve_session(req, request)
+        if session is None:
+            return _expired_response()
+        result = await asyncio.to_thread(
+            optimize, session.aut_min, session.variables, req.objective_var,
+            req.direction, session.integers,
+        )
+    except (UnexpectedInput, AssertionError, ValueError) as exc:
+        return Response(
+            content=f"Syntax error:\n{str(exc)}",
+            media_type="text/plain",
+            status_code=400,
+        )
+    except BudgetExceeded as exc:
+        return _budget_response(exc)
+    except (PoolBusy, JobTimeout, JobCancelled, WorkerCrashed) as exc:
+        return _pool_error_response(exc)
+
+    return JSONResponse(content={**result, "handle": handle})
+
+
+class BatchRequest(BaseModel):
+    formulas: List[str]
+
+@app.post("/automaton/batch")
+async def automaton_batch(req: BatchRequest):
+    """Compile many formulas, sharing common subformulas.
+
+    Streams one JSON line per formula (NDJSON) in the order they finish.
+    """
+    store = AutomatonStore(_cache_dir, _cache_max_bytes) if _cache_dir else None
+    plan = await asyncio.to_thread(BatchPlan, req.formulas, store, construction_limits)
+
+    async def lines():
+        ready = deque()
+        running = {}
+        try:
+            for result in plan.immediate:
+                yield _batch_line(result)
+            while not plan.done:
+                ready.extend(plan.ready())
+                # Keep at most one task per worker in flight, so a batch does
+                # not fill the pool's queue on its own.
+                while ready and len(running) < pool.size:
+                    task = ready.popleft()
+                    fn, args = plan.job(task)
+                    running[asyncio.ensure_future(pool.run(fn, *args, timeout=job_timeout))] = task
+                if not running:
+                    # Unfinished tasks none of which can run; an acyclic plan
+                    # never gets here, but the client must not hang.
+                    yield json.dumps({"error": "The batch cannot make progress."}) + "\n"
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                busy = False
+                for future in done:
+                    task = running.pop(future)
+                    exc = future.exception()
+                    if isinstance(exc, PoolBusy):
+                        ready.appendleft(task)
+                        busy = True
+                        continue
+                    results = plan.fail(task, exc) if exc else plan.complete(task, future.result())
+                    for result in results:
+                        yield _batch_line(result)
+                if busy:
+                    await asyncio.sleep(0.1)
+        finally:
+            # The client went away: abandon whatever is still running.
+            for future in running:
+                future.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _batch_line(result):
+    if result.error is not None:
+        exc = result.error
+        if isinstance(exc, UnexpectedInput):
+            try:
+                message = "Syntax error:\n" + exc.get_context(result.formula)
+            except Exception:
+                message = "Syntax error:\n" + str(exc)
+        else:
+            message = str(exc) or type(exc).__name__
+        content = {"index": result.index, "error": message}
+    else:
+        aut = result.aut
+        handle, _ = sessions.create(aut, aut, result.variables, formula=result.formula)
+        content = {
+            "index": result.index,
+            "handle": handle,
+            "variables": result.variables,
+            "num_states": len(aut.get_reachable_states()),
+            "num_final_states": len(aut.final_states),
+            "mata": nfa_to_mata(aut),
         }
-    )
\ No newline at end of file
+    return json.dumps(content) + "\n"
\ No newline at end of file
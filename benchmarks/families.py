@@ -0,0 +1,69 @@
+# families.py
+"""
+Parameterised formula generators for the benchmark suite.
+
+Every family is a function ``size -> formula`` producing input in the same
+syntax the webapp accepts (including macro definitions), so the complete
+pipeline from macro expansion to minimisation is exercised.
+"""
+from typing import Callable, Dict, List
+
+
+def growing_coefficients(size: int) -> str:
+    """One atom whose coefficients and constant grow exponentially.
+
+    The number of carry states of the atomic construction is linear in the
+    sum of the absolute coefficients.
+    """
+    a = 2 ** size + 1
+    b = 2 ** size - 1
+    return f"{a}x - {b}y <= {3 * size}"
+
+
+def many_variables(size: int) -> str:
+    """One atom over *size* variables – the alphabet has 2^size letters."""
+    terms = " + ".join(f"x{i}" for i in range(1, size + 1))
+    return f"{terms} <= {size}"
+
+
+def quantifier_alternation(size: int) -> str:
+    """*size* alternating quantifiers, each step forcing a complementation."""
+    body = " AND ".join(f"x{i} <= x{i + 1} + 1" for i in range(size)) or "x0 <= 1"
+    formula = body
+    for i in range(size, 0, -1):
+        quantifier = "EX" if i % 2 else "ALL"
+        formula = f"{quantifier} x{i}. ({formula})"
+    return formula
+
+
+def long_disjunction(size: int) -> str:
+    """A disjunction of *size* equalities over two shared variables."""
+    return " OR ".join(f"x + {i + 1}y = {3 * i + 1}" for i in range(size))
+
+
+def macro_heavy(size: int) -> str:
+    """A chain of macros where every level calls the previous one twice."""
+    lines = ["m0(x, y) = x + 1 <= y"]
+    for i in range(1, size + 1):
+        lines.append(f"m{i}(x, y) = EX z. (m{i - 1}(x, z) AND m{i - 1}(z, y))")
+    lines.append(f"m{size}(a, b)")
+    return "\n".join(lines)
+
+
+FAMILIES: Dict[str, Callable[[int], str]] = {
+    "growing_coefficients": growing_coefficients,
+    "many_variables": many_variables,
+    "quantifier_alternation": quantifier_alternation,
+    "long_disjunction": long_disjunction,
+    "macro_heavy": macro_heavy,
+}
+
+# Sizes used when no explicit sizes are passed on the command line.  They are
+# chosen so that the full suite finishes in a few minutes on a laptop.
+DEFAULT_SIZES: Dict[str, List[int]] = {
+    "growing_coefficients": [2, 4, 6, 8, 10],
+    "many_variables": [2, 4, 6, 8],
+    "quantifier_alternation": [1, 2, 3, 4],
+    "long_disjunction": [2, 4, 8, 16],
+    "macro_heavy": [1, 2, 3, 4],
+}
@@ -15,7 +15,8 @@ type ExampleSolution = {
 };
 
 type ReorderRequestBody = {
-  aut: string;
+  handle?: string;
+  aut?: string;
   k_solutions: number;
   original_variable_order: string[];
   new_variable_order: string[];
@@ -25,7 +26,8 @@ type ReorderRequestBody = {
 };
 
 type SolutionsRequestBody = {
-  aut: string;
+  handle?: string;
+  aut?: string;
   k_solutions: number;
   original_variable_order: string[];
   new_variable_order: string[];
@@ -39,6 +41,7 @@ export default function Home() {
   const [loading, setLoading] = useState(false);
   const [dotString, setDotString] = useState<string>();
   const [mataString, setMataString] = useState<string>();
+  const [automatonHandle, setAutomatonHandle] = useState<string>();
   const [variables, setVariables] = useState<string[]>([]);
   const [originalVariables, setOriginalVariables] = useState<string[]>([]);
   const [currentVariables, setCurrentVariables] = useState<string[]>([]);
@@ -58,6 +61,30 @@ export default function Home() {
   const fileInputRef = useRef<HTMLInputElement>(null);
   const allSolutionsRef = useRef<ExampleSolution[]>([]);
 
+  // Follow-up requests refer to the automaton by the handle the backend
+  // returned.  If the backend has dropped it (410 Gone), the request is
+  // repeated once with the automaton itself.
+  const postFollowUp = async (
+    url: string,
+    body: ReorderRequestBody | SolutionsRequestBody,
+  ) => {
+    const post = (payload: ReorderRequestBody | SolutionsRequestBody) =>
+      fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+      });
+    const response = await post({ ...body, handle: automatonHandle });
+    if (response.status !== 410) return response;
+    const fallback = { ...body, aut: mataString };
+    if (displayAtomicConstruction) {
+      fallback.formula = input.trim();
+    }
+    return post(fallback);
+  };
+
   // Effect to restore scroll position after loading completes
   useEffect(() => {
     if (!loading && dotString) {
@@ -90,11 +117,13 @@ export default function Home() {
   const handleBuild = async (formulaOverride?: string) => {
     // Save current scroll position before any state changes
     scrollPositionRef.current = window.scrollY;
-    
+    const previousHandle = automatonHandle;
+
     setLoading(true);
     setError(null);
     setDotString(undefined);
     setMataString(undefined);
+    setAutomatonHandle(undefined);
     setBufferSolutions([]);
     setDisplayedSolutions([]);
     setIsFullSolutionSet(false);
@@ -103,9 +132,11 @@ export default function Home() {
         formula: (formulaOverride ?? input).trim(),
         display_labels: displayLabels,
         display_atomic_construction: displayAtomicConstruction,
+        // The automaton being edited, so its unchanged subformulas are reused.
+        handle: previousHandle,
       };
 
-      const response = await fetch('/api/automaton/dot', {
+      const response = await fetch('/api/automaton/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -113,7 +144,7 @@ export default function Home() {
         body: JSON.stringify(requestBody),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorText = await response.text();
         const errorMsg = errorText
           .replace(/\t/g, '    ')
@@ -123,25 +154,55 @@ export default function Home() {
         return;
       }
 
-      const data = await response.json();
-      console.log('API response:', data);
-      setDotString(data.dot);
-      setMataString(data.mata);
-      setVariables(data.variables || []);
-      setOriginalVariables(data.variables || []);
-      setCurrentVariables(data.variables || []);
-      allSolutionsRef.current = data.example_solutions || [];
-      if ((data.example_solutions || []).length < 9) {
-        setDisplayedSolutions(data.example_solutions || []); // Show all if full set
-        setBufferSolutions([]);
-        setIsFullSolutionSet(true);
-      } else {
-        setDisplayedSolutions((data.example_solutions || []).slice(0, 3));
-        setBufferSolutions((data.example_solutions || []).slice(3));
-        setIsFullSolutionSet(false);
+      // One JSON object per line; each part of the result is shown as soon as it arrives.
+      const handleEvent = (data: any) => {
+        switch (data.event) {
+          case 'automaton':
+            setAutomatonHandle(data.handle);
+            setVariables(data.variables || []);
+            setOriginalVariables(data.variables || []);
+            setCurrentVariables(data.variables || []);
+            setNumStates(data.num_states);
+            setNumFinalStates(data.num_final_states);
+            break;
+          case 'solutions':
+            allSolutionsRef.current = data.example_solutions || [];
+            if ((data.example_solutions || []).length < 9) {
+              setDisplayedSolutions(data.example_solutions || []); // Show all if full set
+              setBufferSolutions([]);
+              setIsFullSolutionSet(true);
+            } else {
+              setDisplayedSolutions((data.example_solutions || []).slice(0, 3));
+              setBufferSolutions((data.example_solutions || []).slice(3));
+              setIsFullSolutionSet(false);
+            }
+            break;
+          case 'mata':
+            setMataString(data.mata);
+            break;
+          case 'dot':
+            setDotString(data.dot);
+            break;
+          case 'error':
+            setError(data.error);
+            break;
+        }
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop() ?? '';
+        for (const line of lines) {
+          if (line.trim()) handleEvent(JSON.parse(line));
+        }
       }
-      setNumStates(data.num_states);
-      setNumFinalStates(data.num_final_states);
+      if (buffered.trim()) handleEvent(JSON.parse(buffered));
     } catch (err) {
       const errorMsg = (err instanceof Error ? err.message : 'An error occurred')
         .replace(/\t/g, '    ')
@@ -163,7 +224,6 @@ export default function Home() {
       const numBuffered = bufferSolutions.length;
       const totalNeeded = numDisplayed + numBuffered;
       const requestBody: ReorderRequestBody = {
-        aut: mataString,
         k_solutions: totalNeeded,
         original_variable_order: originalVariables,
         new_variable_order: newVariableOrder,
@@ -171,18 +231,7 @@ export default function Home() {
         display_atomic_construction: displayAtomicConstruction,
       };
 
-      // Add formula to request if display atomic construction is enabled
-      if (displayAtomicConstruction) {
-        requestBody.formula = input.trim();
-      }
-
-      const response = await fetch('/api/automaton/reorder', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(requestBody),
-      });
+      const response = await postFollowUp('/api/automaton/reorder', requestBody);
 
       if (!response.ok) {
         const errorText = await response.text();
@@ -196,6 +245,7 @@ export default function Home() {
 
       const data = await response.json();
       console.log('Reorder API response:', data);
+      setAutomatonHandle(data.handle);
       
       // Update DOT string if provided
       if (data.dot !== null && data.dot !== undefined) {
@@ -235,25 +285,13 @@ export default function Home() {
     setError(null);
     try {
       const requestBody: SolutionsRequestBody = {
-        aut: mataString,
         k_solutions: kOverride ?? kSolutions,
         original_variable_order: originalVariables,
         new_variable_order: currentVariables,
         display_atomic_construction: displayAtomicConstruction,
       };
 
-      // Add formula to request if display atomic construction is enabled
-      if (displayAtomicConstruction) {
-        requestBody.formula = input.trim();
-      }
-
-      const response = await fetch('/api/automaton/solutions', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(requestBody),
-      });
+      const response = await postFollowUp('/api/automaton/solutions', requestBody);
 
       if (!response.ok) {
         const errorText = await response.text();
@@ -267,6 +305,7 @@ export default function Home() {
 
       const data = await response.json();
       console.log('Solutions API response:', data);
+      setAutomatonHandle(data.handle);
       
       const newSolutions = data.example_solutions || [];
       console.log('=== SOLUTIONS RESPONSE RECEIVED ===');
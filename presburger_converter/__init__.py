@@ -1,6 +1,10 @@
-from .pipeline import formula_to_aut, test_formula
+from ._lazy import attach
 
-__all__ = [
-    "formula_to_aut",
-    "test_formula",
-]
\ No newline at end of file
+__getattr__, __dir__, __all__ = attach(__name__, {
+    "formula_to_aut": ".pipeline",
+    "test_formula": ".pipeline",
+    "formulas_to_auts": ".batch",
+    "build_parallel": ".batch",
+    "SessionStore": ".sessions",
+    "SubformulaCache": ".incremental",
+})
\ No newline at end of file
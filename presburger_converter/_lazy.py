@@ -0,0 +1,25 @@
+"""PEP 562 helper for lazily re-exporting names from submodules."""
+import importlib
+
+
+def attach(package_name, exports):
+    """Return ``(__getattr__, __dir__, __all__)`` for a package ``__init__``.
+
+    *exports* maps every public name to the relative submodule defining it.
+    The submodule is imported on first attribute access only, so importing a
+    package does not pull in libmata, the Lark parser or graphviz until they
+    are actually needed.
+    """
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+        module = importlib.import_module(exports[name], package_name)
+        value = getattr(module, name)
+        setattr(importlib.import_module(package_name), name, value)
+        return value
+
+    def __dir__():
+        package = importlib.import_module(package_name)
+        return sorted(set(vars(package)) | set(exports))
+
+    return __getattr__, __dir__, list(exports)
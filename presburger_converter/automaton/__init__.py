@@ -1,8 +1,15 @@
-from .automaton_builder import build_automaton
-from .mata_io import nfa_to_mata, nfa_from_mata
+from presburger_converter._lazy import attach
 
-__all__ = [
-    "build_automaton",
-    "nfa_to_mata",
-    "nfa_from_mata"
-]
\ No newline at end of file
+__getattr__, __dir__, __all__ = attach(__name__, {
+    "build_automaton": ".automaton_builder",
+    "permute_variables": ".automaton_builder",
+    "nfa_to_mata": ".mata_io",
+    "nfa_from_mata": ".mata_io",
+    "nfa_to_bytes": ".mata_io",
+    "nfa_from_bytes": ".mata_io",
+    "AutomatonStore": ".store",
+    "Budget": ".budget",
+    "BudgetExceeded": ".budget",
+    "BitPermutation": ".labels",
+    "cube_cover": ".labels",
+})
\ No newline at end of file
@@ -1,9 +1,11 @@
 # automaton_builder.py
-from collections import deque
+from collections import OrderedDict
 from copy import deepcopy
-from math import floor
 
 from presburger_converter.parsing.ast_nodes import *
+from presburger_converter.automaton.budget import check, check_automaton
+from presburger_converter.automaton.labels import BitPermutation
+from presburger_converter.automaton.mata_io import nfa_from_bytes
 import itertools
 import libmata.nfa.nfa as mata_nfa
 from libmata.alphabets import *
@@ -19,70 +21,112 @@ def setup(k):
     #print(f"alphabet: {a.get_alphabet_symbols()}")
     config['alphabet'] = a
 
-def build_automaton(node, mode="determinize") -> (mata_nfa.Nfa, [str]):
+class Prebuilt:
+    """Leaf standing for a subformula whose automaton was built elsewhere.
+
+    *data* is the automaton in the binary format of ``mata_io``, so a
+    ``Prebuilt`` can be sent to another process and every use gets a fresh
+    copy (the construction modifies automata in place).  Within one process
+    *data* may also be an automaton, which is then copied for every use.
+    """
+    def __init__(self, data, variables):
+        self.data = data
+        self.variables = list(variables)
+
+    def __repr__(self):
+        return f"<prebuilt over {', '.join(self.variables)}>"
+
+
+def build_automaton(node, mode="determinize", trace=None, budget=None, integers=False) -> (mata_nfa.Nfa, [str]):
+    """Build the automaton for *node*.
+
+    By default variables range over the naturals (LSBF words, padded with
+    zeros).  With *integers* they range over ℤ in two's complement: the last
+    letter of a word holds the sign bits and may be repeated.
+
+    If a :class:`~presburger_converter.profiling.ConstructionTrace` is given,
+    every visited node is recorded as a nested stage together with the size
+    of the automaton it produced.  A
+    :class:`~presburger_converter.automaton.budget.Budget` limits the size of
+    every intermediate automaton and the time and memory spent; exceeding it
+    raises :class:`~presburger_converter.automaton.budget.BudgetExceeded`.
+    """
+    if budget is not None:
+        budget.node = type(node).__name__
+    if trace is None:
+        return _build_automaton(node, mode, trace, budget, integers)
+    info = {"formula": repr(node)} if isinstance(node, LessEqual) else {}
+    if isinstance(node, Exists):
+        info["var"] = str(node.var)
+    with trace.stage(type(node).__name__, **info) as record:
+        aut, variables = _build_automaton(node, mode, trace, budget, integers)
+    trace.record_automaton(record, aut, variables)
+    return aut, variables
+
+
+def _minimize(aut, budget):
+    check(budget)
+    aut = mata_nfa.minimize(aut)
+    check_automaton(budget, aut)
+    return aut
+
+
+def _build_automaton(node, mode, trace, budget, integers=False):
     global config
-    if isinstance(node, LessEqual):
+    if isinstance(node, Prebuilt):
+        if isinstance(node.data, bytes):
+            return nfa_from_bytes(node.data), list(node.variables)
+        return node.data.deepcopy(), list(node.variables)
+
+    elif isinstance(node, LessEqual):
         # Atomic case: build automaton for t <= u
-        aut, variables = build_atomic_automaton(node)
+        aut, variables = build_atomic_automaton(node, budget, integers)
         if mode == "always":
-            aut = mata_nfa.minimize(aut)
-        # print(aut.to_dot_str())
-        # aut = project_variable(aut, 0 )
-        #print(f"automaton for {node}:")
-        #print(aut.to_dot_str())
+            aut = _minimize(aut, budget)
         return aut, variables
 
     elif isinstance(node, Or):
-        left_automaton, left_variables = build_automaton(node.left, mode)
-        right_automaton, right_variables = build_automaton(node.right, mode)
-        aut, variables = union(left_automaton, right_automaton, left_variables, right_variables)
+        left_automaton, left_variables = build_automaton(node.left, mode, trace, budget, integers)
+        right_automaton, right_variables = build_automaton(node.right, mode, trace, budget, integers)
+        if budget is not None:
+            budget.node = "Or"
+        aut, variables = union(left_automaton, right_automaton, left_variables, right_variables, budget)
         if mode == "always":
-            aut = mata_nfa.minimize(aut)
-        #print(f"automaton for {node}:")
-        #print(aut.to_dot_str())
+            aut = _minimize(aut, budget)
         return aut, variables
 
     elif isinstance(node, Not):
-        child_automaton, variables = build_automaton(node.expr, mode)
-        #child_automaton = mata_nfa.minimize(child_automaton)
-        #print(f"child automaton: {child_automaton.to_dot_str()}")
+        child_automaton, variables = build_automaton(node.expr, mode, trace, budget, integers)
+        if budget is not None:
+            budget.node = "Not"
         if not is_deterministic(child_automaton):
-            #print("Child automaton is not deterministic, determinizing...")
             if mode in ["always", "minimize"]:
-                child_automaton = mata_nfa.minimize(child_automaton)
+                child_automaton = _minimize(child_automaton, budget)
             else:
-                child_automaton = determinize(child_automaton)
-            #print(f"determinized automaton \n: {child_automaton.to_dot_str()}")
-        #child_automaton = mata_nfa.complement(child_automaton, config['alphabet'])
+                child_automaton = determinize(child_automaton, budget)
         if mode in ["always", "minimize"]:
-            child_automaton = complete(child_automaton, variables)
-        #print(f"completed automaton \n: {child_automaton.to_dot_str()}")
+            child_automaton = complete(child_automaton, variables, budget)
         child_automaton = complement(child_automaton)
-        #child_automaton = mata_nfa.minimize(child_automaton)
-        #print(f"complemented automaton \n: {child_automaton.to_dot_str()}")
-        #child_automaton = mata_nfa.complement(child_automaton, alphabet = config['alphabet'])
-        #print(f"child automaton: {child_automaton.to_dot_str()}")
-        #print(f"automaton for {node}:")
-        #print(child_automaton.to_dot_str())
+        if integers:
+            child_automaton = reject_empty_word(child_automaton)
         return child_automaton, variables
 
     elif isinstance(node, Exists):
-        child_automaton, variables = build_automaton(node.formula, mode)
+        child_automaton, variables = build_automaton(node.formula, mode, trace, budget, integers)
+        if budget is not None:
+            budget.node = "Exists"
         setup(len(variables) - 1)
         index = variables.index(node.var)
-        #print(f"automaton for {node}:")
-        aut, variables = project_variable(child_automaton, index, variables)
+        aut, variables = project_variable(child_automaton, index, variables, budget, integers)
         if mode == "always":
-            aut = mata_nfa.minimize(aut)
-        #aut = mata_nfa.minimize(aut)
-        #print(aut.to_dot_str())
+            aut = _minimize(aut, budget)
         return aut, variables
 
     else:
         raise ValueError(f"Unsupported node type in build_automaton: {type(node)}")
 
 
-def project_variable(aut : mata_nfa.Nfa , index, variables):
+def project_variable(aut : mata_nfa.Nfa , index, variables, budget=None, integers=False):
     # This function will project the variable out of the automaton
     # You will need to implement this based on your automata library
     # for each transistion, do calculation
@@ -102,12 +146,18 @@ def project_variable(aut : mata_nfa.Nfa , index, variables):
         new_symbol = symbol % 2**index + ((symbol - symbol % 2**(index+1)) // 2)
         #print(f"Replaced {symbol} with {new_symbol} from {source} to {target}")
         new_aut.add_transition(source, new_symbol, target)
+    check_automaton(budget, new_aut)
+    if integers:
+        _saturate_sign_letters(new_aut, final_states, budget)
+        del variables[index]
+        return new_aut, variables
     transitions = new_aut.get_trans_as_sequence()
     workset = deepcopy(final_states)
     visited = set()
     #print(f"final states: {final_states}")
     while workset:
         #print(f"looping with {workset}")
+        check(budget)
         state = workset.pop()
         for transition in transitions:
             if transition.target == state:
@@ -123,7 +173,131 @@ def project_variable(aut : mata_nfa.Nfa , index, variables):
     del variables[index]
     return new_aut, variables
 
-def build_atomic_automaton(node):
+# Atoms with at least this many variables compute the successors of a whole
+# BFS level at once with NumPy, if it is installed.
+NUMPY_MIN_VARS = 8
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:  # optional dependency
+        return None
+    return numpy
+
+def _letter_sums(a):
+    """``sums[symbol]`` = dot product of the coefficients *a* with the letter."""
+    sums = [0] * (1 << len(a))
+    for symbol in range(1, len(sums)):
+        low = symbol & -symbol
+        sums[symbol] = sums[symbol ^ low] + a[low.bit_length() - 1]
+    return sums
+
+# Number of (carry, letter) pairs computed at once.
+_SUCCESSOR_CHUNK = 1 << 16
+
+def _successors(carries, sums, np=None):
+    """Successors ``floor((k - sums[symbol]) / 2)`` of every carry k.
+
+    Returns the target state ids row by row and the set of carries reached.
+    With NumPy all rows are computed as one array operation.
+    """
+    if np is None:
+        rows = [[(k - s) >> 1 for s in sums] for k in carries]
+        reached = set().union(*rows)
+        return [[2 * j if j >= 0 else -2 * j + 1 for j in row] for row in rows], reached
+    succ = (np.array(carries, dtype=np.int64)[:, None] - np.array(sums, dtype=np.int64)) >> 1
+    ids = np.where(succ >= 0, 2 * succ, -2 * succ + 1)
+    return ids.tolist(), set(np.unique(succ).tolist())
+
+# Largest carry x letter table built in one piece; beyond it the carries are
+# explored breadth-first instead.
+_TABLE_LIMIT = 1 << 22
+
+def _carry_table(lo, hi, sums, np=None):
+    """Successor table of the carries lo..hi as ``(dense, ids)``.
+
+    ``dense[i][symbol]`` is the index (carry - lo) of the successor of carry
+    lo + i, ``ids[i][symbol]`` its state id.  With NumPy both are arrays.
+    """
+    if np is None:
+        dense = [[((k - s) >> 1) - lo for s in sums] for k in range(lo, hi + 1)]
+        ids = [[encode(lo + j) for j in row] for row in dense]
+        return dense, ids
+    succ = (np.arange(lo, hi + 1, dtype=np.int64)[:, None] - np.array(sums, dtype=np.int64)) >> 1
+    return succ - lo, np.where(succ >= 0, 2 * succ, -2 * succ + 1)
+
+def _reachable_rows(dense, seeds, np=None, budget=None):
+    """Indices of the table rows reachable from the rows *seeds*, ascending."""
+    if np is None:
+        visited = bytearray(len(dense))
+        frontier = list(set(seeds))
+        for i in frontier:
+            visited[i] = 1
+        count = len(frontier)
+        while frontier:
+            check(budget, count)
+            next_frontier = []
+            for i in frontier:
+                for j in dense[i]:
+                    if not visited[j]:
+                        visited[j] = 1
+                        next_frontier.append(j)
+            count += len(next_frontier)
+            frontier = next_frontier
+        return [i for i, v in enumerate(visited) if v]
+    visited = np.zeros(len(dense), dtype=bool)
+    frontier = np.unique(np.array(list(seeds), dtype=np.int64))
+    while frontier.size:
+        visited[frontier] = True
+        check(budget, int(visited.sum()))
+        successors = np.unique(dense[frontier])
+        frontier = successors[~visited[successors]]
+    return np.flatnonzero(visited).tolist()
+
+def _saturate_sign_letters(aut, final_states, budget=None):
+    """Accept ``u σ`` whenever ``u σ σ…σ`` was accepted (two's complement).
+
+    After a projection the remaining variables may need more repetitions of
+    their sign letter σ than before.  For every letter the states from which
+    σ* reaches a final state are computed backwards, and every σ-transition
+    into one of them gets a copy into a new final state without successors.
+    """
+    predecessors = {}
+    for t in aut.get_trans_as_sequence():
+        predecessors.setdefault(t.symbol, {}).setdefault(t.target, []).append(t.source)
+    accept = None
+    for symbol, pred in predecessors.items():
+        check(budget)
+        reach = set(final_states)
+        workset = list(reach)
+        while workset:
+            for source in pred.get(workset.pop(), ()):
+                if source not in reach:
+                    reach.add(source)
+                    workset.append(source)
+        sources = {p for q in reach for p in pred.get(q, ())}
+        if sources and accept is None:
+            accept = aut.add_new_state()
+        for source in sources:
+            aut.add_transition(source, symbol, accept)
+    if accept is not None:
+        final_states.add(accept)
+    aut.final_states = final_states
+
+def reject_empty_word(aut : mata_nfa.Nfa):
+    """Make the initial states non-accepting; the empty word encodes no integers."""
+    final_states = set(aut.final_states)
+    initial = [q for q in aut.initial_states if q in final_states]
+    if not initial:
+        return aut
+    start = aut.add_new_state()
+    for q in initial:
+        for t in aut.get_trans_from_state_as_sequence(q):
+            aut.add_transition(start, t.symbol, t.target)
+    aut.initial_states = [start] + [q for q in aut.initial_states if q not in final_states]
+    return aut
+
+def build_atomic_automaton(node, budget=None, integers=False):
     # This function will build an automaton for the atomic case
     # You will need to implement this based on your automata library
     b, map = count_tree(node)
@@ -134,34 +308,70 @@ def build_atomic_automaton(node):
     for var in map.keys():
         x.append(var)
         a.append(map.get(var))
-    #print(f"b: {b}, x: {x}, a: {a}")
+    sums = _letter_sums(a)
+    # Carries in lo..hi only have successors in lo..hi, and every other
+    # carry moves towards that interval, roughly halving its distance.
+    lo = -sum(c for c in a if c > 0)
+    hi = -sum(c for c in a if c < 0)
+    np = None
+    # Carries stay within max(|b|, sum |a_i|), which must fit into int64.
+    if n >= NUMPY_MIN_VARS and max(abs(b), hi - lo) < 2**62:
+        np = _numpy()
+    use_table = (hi - lo + 1) << n <= _TABLE_LIMIT
     aut = mata_nfa.Nfa()
     sb = aut.add_state(encode(b))
-    if b >= 0:
-        final_states = {sb}
-    else:
-        final_states = set()
     aut.initial_states = {sb}
-    states = {sb}
-    worklist = deque()
-    worklist.append(sb)
-    while worklist:
-        state = worklist.popleft()
-        for zeta in itertools.product([0, 1], repeat=n):
-            k = decode(state)
-            dotproduct = sum(zeta[i] * a[i] for i in range(n))
-            j = floor((k - dotproduct) / 2)
-            if encode(j) not in states:
-                sj = aut.add_state(encode(j))
-                if j >= 0:
-                    final_states.add(sj)
-                worklist.append(sj)
-                states.add(sj)
-            else:
-                sj = encode(j)
-            aut.add_transition(state, lsbf_to_int(zeta), sj)
-    aut.final_states = final_states
-    #print("finished")
+    add = aut.add_transition
+    seen = {b}
+    inside = set()
+    # Breadth-first, one level at a time; a state's id is encode(carry).
+    # With the table, only the carries outside lo..hi are explored this way.
+    chunk = max(1, _SUCCESSOR_CHUNK >> n)
+    frontier = [b] if not use_table or not lo <= b <= hi else []
+    while frontier:
+        next_frontier = []
+        for start in range(0, len(frontier), chunk):
+            carries = frontier[start:start + chunk]
+            rows, reached = _successors(carries, sums, np)
+            if use_table:
+                inside |= {j for j in reached if lo <= j <= hi}
+                reached -= inside
+            for j in sorted(reached - seen):
+                next_frontier.append(j)
+            seen |= reached
+            for k, row in zip(carries, rows):
+                check(budget, len(seen), len(seen) << n)
+                state = encode(k)
+                for symbol, target in enumerate(row):
+                    add(state, symbol, target)
+        frontier = next_frontier
+
+    if use_table:
+        if lo <= b <= hi:
+            seen.discard(b)
+            inside.add(b)
+        dense, ids = _carry_table(lo, hi, sums, np)
+        rows = _reachable_rows(dense, (k - lo for k in inside), np, budget)
+        for count, i in enumerate(rows, len(seen) + 1):
+            check(budget, count, count << n)
+            state = encode(lo + i)
+            row = ids[i] if np is None else ids[i].tolist()
+            for symbol, target in enumerate(row):
+                add(state, symbol, target)
+        seen.update(lo + i for i in rows)
+    aut.add_state(max(encode(k) for k in seen))
+    if not integers:
+        aut.final_states = {encode(k) for k in seen if k >= 0}
+        return aut, x
+    # Reading the sign letter ζ as the last one leaves x' = -ζ, which
+    # satisfies a·x' <= k iff k + a·ζ >= 0.
+    accept = aut.add_new_state()
+    for k in seen:
+        state = encode(k)
+        for symbol, s in enumerate(sums):
+            if k + s >= 0:
+                add(state, symbol, accept)
+    aut.final_states = {accept}
     return aut, x
 
 
@@ -169,7 +379,7 @@ def union_nfa(automaton1, automaton2):
     pass
 
 
-def expand_transitions(automaton, variables, mapping, old_num_vars):
+def expand_transitions(automaton, variables, mapping, old_num_vars, budget=None):
     """
     Expands transitions in an automaton for a new set of variables.
 
@@ -183,8 +393,11 @@ def expand_transitions(automaton, variables, mapping, old_num_vars):
                  So, mapping keys are indices in the *new* variable set,
                  and values are indices in the *old* variable set from which to take the bit.
         old_num_vars: The number of variables the automaton's labels originally corresponded to.
+        budget: Optional Budget; the number of transitions after expansion is
+                checked before any of them is added.
     """
     num_vars = len(variables)
+    num_states = automaton.num_of_states()
 
     # --- Phase 1: Collect all original transition data ---
     # This avoids issues with modifying the automaton while iterating over its transitions.
@@ -216,6 +429,10 @@ def expand_transitions(automaton, variables, mapping, old_num_vars):
             print(f"Warning: Encountered unknown transition format: {t_info}")
             continue
 
+    # Every transition becomes 2**(number of unmapped variables) transitions.
+    num_new_vars = num_vars - sum(1 for old_idx in mapping.values() if old_idx is not None)
+    check(budget, num_states, len(original_transitions_data) * 2**num_new_vars)
+
     # --- Phase 2: Remove all original transitions that will be expanded ---
     # It's crucial that remove_trans can correctly identify and remove the transition
     # based on original_transition_ref.
@@ -278,7 +495,7 @@ def expand_transitions(automaton, variables, mapping, old_num_vars):
     return automaton
 
 
-def union(automaton1, automaton2, variables1, variables2):
+def union(automaton1, automaton2, variables1, variables2, budget=None):
     variables_merged = deepcopy(variables1)
     for var in variables2:
         if var not in variables1:
@@ -292,18 +509,22 @@ def union(automaton1, automaton2, variables1, variables2):
         new_index = variables_merged.index(var)
         old_index = variables2.index(var)
         map2[new_index] = old_index
-    automaton1 = expand_transitions(automaton1, variables_merged, map1, len(variables1))
+    automaton1 = expand_transitions(automaton1, variables_merged, map1, len(variables1), budget)
     #print(f"automaton1 after expansion: {automaton1.to_dot_str()}")
-    automaton2 = expand_transitions(automaton2, variables_merged, map2, len(variables2))
+    automaton2 = expand_transitions(automaton2, variables_merged, map2, len(variables2), budget)
     #print(f"automaton2 after expansion: {automaton2.to_dot_str()}")
-    return mata_nfa.union(automaton1, automaton2), variables_merged
+    aut = mata_nfa.union(automaton1, automaton2)
+    check_automaton(budget, aut)
+    return aut, variables_merged
 
 
-def complete(automaton : mata_nfa.Nfa, variables):
+def complete(automaton : mata_nfa.Nfa, variables, budget=None):
     new_transitions = []
     states = automaton.get_reachable_states()
+    num_transitions = automaton.get_num_of_transitions()
     max_state = 0
     for state in states:
+        check(budget, len(states) + 1, num_transitions + len(new_transitions))
         if max_state < state:
             max_state = state
         transitions = automaton.get_trans_from_state_as_sequence(state)
@@ -342,10 +563,47 @@ def complement(automaton : mata_nfa.Nfa):
     #print(f"Final states: {new_final_states}")
     return automaton
 
-def determinize(automaton : mata_nfa.Nfa):
-    # This function will discretize the automaton
-    # You will need to implement this based on your automata library
-    return mata_nfa.determinize(automaton)
+def determinize(automaton : mata_nfa.Nfa, budget=None):
+    # libmata determinizes natively, so the budget can only be checked
+    # before and after.
+    check(budget)
+    aut = mata_nfa.determinize(automaton)
+    check_automaton(budget, aut)
+    return aut
+
+# Recently permuted automata: (id(aut), old order, new order) -> (aut, result).
+# An entry keeps its source automaton alive, so the id cannot be reused.
+_PERMUTED_CACHE_SIZE = 32
+_permuted = OrderedDict()
+
+def permute_variables(aut : mata_nfa.Nfa, old_order, new_order):
+    """Return *aut* with its labels over *new_order* instead of *old_order*.
+
+    The states stay the same; every symbol is mapped through the
+    :class:`~presburger_converter.automaton.labels.BitPermutation` of the
+    reorder.  Results are cached per (automaton, order) and shared between
+    callers, so neither *aut* nor the result may be modified afterwards.
+    """
+    key = (id(aut), tuple(old_order), tuple(new_order))
+    hit = _permuted.get(key)
+    if hit is not None and hit[0] is aut:
+        _permuted.move_to_end(key)
+        return hit[1]
+    perm = BitPermutation.between(old_order, new_order)
+    if perm.is_identity:
+        return aut
+    transitions = aut.get_trans_as_sequence()
+    symbols = perm.apply([t.symbol for t in transitions])
+    new_aut = mata_nfa.Nfa(aut.num_of_states())
+    new_aut.initial_states = aut.initial_states
+    new_aut.final_states = aut.final_states
+    add = new_aut.add_transition
+    for t, symbol in zip(transitions, symbols):
+        add(t.source, symbol, t.target)
+    _permuted[key] = (aut, new_aut)
+    if len(_permuted) > _PERMUTED_CACHE_SIZE:
+        _permuted.popitem(last=False)
+    return new_aut
 
 def count_tree(node):
     """Return `(constant, coeffs)` for a linear arithmetic constraint.
@@ -407,6 +665,67 @@ def count_tree(node):
     return constant, coeffs
 
 
+def atom_key(node) -> str:
+    """Canonical text of an atom: its constant and coefficients.
+
+    Two atoms have the same key exactly when they compile to the same
+    automaton over the same variable order, which follows the order of the
+    coefficients; unlike ``repr`` it does not depend on how the terms are
+    written.
+    """
+    constant, coeffs = count_tree(node)
+    return repr((constant, tuple(coeffs.items())))
+
+
+def formula_children(node, caller: str = "formula_children") -> tuple:
+    """Subformulas of a node of a normalized formula; atoms have none.
+
+    *caller* names the function walking the formula in the error raised for
+    any other node.
+    """
+    if isinstance(node, LessEqual):
+        return ()
+    if isinstance(node, Or):
+        return node.left, node.right
+    if isinstance(node, Not):
+        return (node.expr,)
+    if isinstance(node, Exists):
+        return (node.formula,)
+    raise ValueError(f"Unsupported node type in {caller}: {type(node)}")
+
+
+def with_children(node, children):
+    """*node* over new *children*, given in the order of ``formula_children``."""
+    if isinstance(node, LessEqual):
+        return node
+    if isinstance(node, Or):
+        return Or(*children)
+    if isinstance(node, Not):
+        return Not(*children)
+    # Structurally equal nodes may come from different inputs whose variable
+    # names are parser tokens of different types; use plain str.
+    return Exists(str(node.var), *children)
+
+
+def formula_key(node) -> str:
+    """Canonical text of a normalized formula, built from ``atom_key``.
+
+    ``Prebuilt`` leaves are rejected: their automata come from elsewhere, so
+    nothing in the formula identifies them.
+    """
+    if isinstance(node, Prebuilt):
+        raise ValueError("formula_key: a Prebuilt leaf cannot be part of a store key")
+    if isinstance(node, LessEqual):
+        return f"[{atom_key(node)}]"
+    if isinstance(node, Or):
+        return f"(OR {formula_key(node.left)} {formula_key(node.right)})"
+    if isinstance(node, Not):
+        return f"(NOT {formula_key(node.expr)})"
+    if isinstance(node, Exists):
+        return f"(EX {node.var} {formula_key(node.formula)})"
+    raise ValueError(f"Unsupported node type in formula_key: {type(node)}")
+
+
 
 def is_deterministic(aut : mata_nfa.Nfa):
     # This function will check if the automaton is deterministic
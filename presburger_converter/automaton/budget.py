@@ -0,0 +1,147 @@
+# budget.py
+"""
+Resource limits for the automaton construction.
+
+A :class:`Budget` is handed to ``build_automaton`` (usually through
+``formula_to_aut``) and checked inside the construction loops.  Once a limit
+is crossed a :class:`BudgetExceeded` is raised which carries the statistics
+gathered up to that point, so the caller can report how far the
+construction got instead of running out of memory.
+
+The libmata operations (determinization, minimization, union) run in native
+code and cannot be interrupted; their results are checked as soon as they
+return, and the deadline is checked before they start.
+"""
+from __future__ import annotations
+
+import os
+import resource
+import time
+from typing import Any, Dict, Optional
+
+# How often (seconds) the resident set size is sampled while checking.
+_MEMORY_SAMPLE_INTERVAL = 0.05
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # No procfs: fall back to the peak, which is in KiB on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class BudgetExceeded(Exception):
+    """A construction limit was exceeded.
+
+    Attributes
+    ----------
+    resource : str
+        ``"states"``, ``"transitions"``, ``"time"`` or ``"memory"``.
+    limit, value
+        The configured limit and the value that crossed it.
+    stats : dict
+        Partial statistics: elapsed time, peak states/transitions, memory
+        and the AST node under construction when the limit was hit.
+    """
+
+    def __init__(self, resource: str, limit, value, stats: Dict[str, Any]):
+        super().__init__(resource, limit, value, stats)
+        self.resource = resource
+        self.limit = limit
+        self.value = value
+        self.stats = stats
+
+    def __str__(self) -> str:
+        units = {"time": " s", "memory": " bytes"}.get(self.resource, f" {self.resource}")
+        where = f" while building {self.stats['node']}" if self.stats.get("node") else ""
+        return f"construction exceeded the limit of {self.limit}{units}{where}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"resource": self.resource, "limit": self.limit,
+                "value": self.value, "stats": self.stats}
+
+
+class Budget:
+    """Limits of one construction; ``None`` disables a limit.
+
+    Parameters
+    ----------
+    max_states : int
+        Bound on the number of states of every intermediate automaton.
+    max_transitions : int
+        Bound on the number of transitions of every intermediate automaton.
+    deadline_s : float
+        Wall-clock seconds from the creation of the budget.
+    max_memory_bytes : int
+        Bound on the resident set size of the process.
+    """
+
+    def __init__(self, max_states: Optional[int] = None,
+                 max_transitions: Optional[int] = None,
+                 deadline_s: Optional[float] = None,
+                 max_memory_bytes: Optional[int] = None):
+        self.max_states = max_states
+        self.max_transitions = max_transitions
+        self.deadline_s = deadline_s
+        self.max_memory_bytes = max_memory_bytes
+        self.node: Optional[str] = None          # AST node under construction
+        self.peak_states = 0
+        self.peak_transitions = 0
+        self.memory_bytes = 0
+        self._start = time.monotonic()
+        self._deadline = self._start + deadline_s if deadline_s is not None else None
+        self._next_memory_sample = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistics gathered so far."""
+        return {
+            "node": self.node,
+            "elapsed_s": time.monotonic() - self._start,
+            "peak_states": self.peak_states,
+            "peak_transitions": self.peak_transitions,
+            "memory_bytes": self.memory_bytes,
+        }
+
+    def _exceeded(self, resource: str, limit, value):
+        return BudgetExceeded(resource, limit, value, self.stats())
+
+    def check(self, states: int = 0, transitions: int = 0) -> None:
+        """Check the current sizes, the deadline and (sampled) memory."""
+        if states > self.peak_states:
+            self.peak_states = states
+            if self.max_states is not None and states > self.max_states:
+                raise self._exceeded("states", self.max_states, states)
+        if transitions > self.peak_transitions:
+            self.peak_transitions = transitions
+            if self.max_transitions is not None and transitions > self.max_transitions:
+                raise self._exceeded("transitions", self.max_transitions, transitions)
+        if self._deadline is None and self.max_memory_bytes is None:
+            return
+        now = time.monotonic()
+        if self._deadline is not None and now > self._deadline:
+            raise self._exceeded("time", self.deadline_s, round(now - self._start, 3))
+        if self.max_memory_bytes is not None and now >= self._next_memory_sample:
+            self._next_memory_sample = now + _MEMORY_SAMPLE_INTERVAL
+            self.memory_bytes = max(self.memory_bytes, _rss_bytes())
+            if self.memory_bytes > self.max_memory_bytes:
+                raise self._exceeded("memory", self.max_memory_bytes, self.memory_bytes)
+
+    def check_automaton(self, aut) -> None:
+        """Check the size of an automaton returned by a libmata operation."""
+        self.check(aut.num_of_states(), aut.get_num_of_transitions())
+
+
+def check(budget: Optional[Budget], states: int = 0, transitions: int = 0) -> None:
+    """``budget.check(...)`` if a budget is given, nothing otherwise."""
+    if budget is not None:
+        budget.check(states, transitions)
+
+
+def check_automaton(budget: Optional[Budget], aut) -> None:
+    """``budget.check_automaton(aut)`` if a budget is given, nothing otherwise."""
+    if budget is not None:
+        budget.check_automaton(aut)
@@ -0,0 +1,249 @@
+# labels.py
+"""
+Transition labels as integer bit masks.
+
+A symbol of the automata built here is a *width*-bit integer whose bit i
+belongs to variable i.  A set of symbols (the label of an edge) is written
+compactly as a cover by *cubes* ``(value, care)``: a cube matches every
+symbol that agrees with *value* on the bits set in *care*; all other bits
+are wildcards.  Everything that formats, permutes or merges labels (DOT
+rendering, solution descriptions, the binary automaton format) works on
+these integers and only turns them into strings at the very end.
+
+:func:`cube_cover` computes a small cover.  Labels of up to ``EXACT_LIMIT``
+symbols get the Quine–McCluskey prime implicants (merged bucket by bucket
+of equal care mask and popcount) and a cover chosen from them by essential
+primes, a greedy pick and a redundancy pass.  Larger labels use an
+Espresso-like heuristic that expands every uncovered symbol into a prime
+cube and then drops redundant cubes.  :func:`split_cover` is a cheaper exact
+cover for when size matters less than speed.
+
+A variable reorder is a :class:`BitPermutation`, applied to symbols through
+precomputed per-byte lookup tables.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+Cube = Tuple[int, int]
+
+# Labels with more symbols than this are covered heuristically.
+EXACT_LIMIT = 1024
+
+
+def symbol_to_bits(symbol: int, width: int) -> str:
+    """LSB-first bit-string of *symbol*, i.e. variable i at position i."""
+    return f"{symbol:0{width}b}"[::-1] if width else ""
+
+
+def cube_to_pattern(value: int, care: int, width: int) -> str:
+    """LSB-first bit-string of a cube with ``*`` at the don't-care bits."""
+    return "".join(
+        ("1" if value >> i & 1 else "0") if care >> i & 1 else "*"
+        for i in range(width)
+    )
+
+
+def format_cover(cubes: Iterable[Cube], width: int, sep: str = ", ") -> str:
+    """The patterns of *cubes*, sorted and joined by *sep*."""
+    return sep.join(sorted(cube_to_pattern(v, c, width) for v, c in cubes))
+
+
+def cube_members(value: int, care: int, width: int) -> Iterator[int]:
+    """Every symbol matched by the cube ``(value, care)``."""
+    free = ~care & ((1 << width) - 1)
+    sub = free
+    while True:
+        yield value | sub
+        if sub == 0:
+            return
+        sub = (sub - 1) & free
+
+
+def prime_implicants(symbols: Iterable[int], width: int) -> List[Cube]:
+    """All prime cubes of the set *symbols* (Quine–McCluskey).
+
+    Two cubes can only merge if they have the same care mask and their
+    values differ in one cared bit, i.e. they sit in neighbouring popcount
+    buckets; every cube is looked up against the next bucket bit by bit
+    instead of being compared with every other cube.
+    """
+    full = (1 << width) - 1
+    current: Set[Cube] = {(s, full) for s in symbols}
+    primes: List[Cube] = []
+    while current:
+        buckets: Dict[Tuple[int, int], Set[int]] = {}
+        for value, care in current:
+            buckets.setdefault((care, bin(value).count("1")), set()).add(value)
+        merged: Set[Cube] = set()
+        larger: Set[Cube] = set()
+        for (care, ones), values in buckets.items():
+            upper = buckets.get((care, ones + 1))
+            if not upper:
+                continue
+            for value in values:
+                zeros = care & ~value
+                while zeros:
+                    bit = zeros & -zeros
+                    zeros ^= bit
+                    if value | bit in upper:
+                        larger.add((value, care & ~bit))
+                        merged.add((value, care))
+                        merged.add((value | bit, care))
+        primes.extend(current - merged)
+        current = larger
+    return primes
+
+
+def _select(primes: List[Cube], symbols: Set[int], width: int) -> List[Cube]:
+    """A small subset of *primes* that still covers *symbols*."""
+    members = [set(cube_members(v, c, width)) for v, c in primes]
+    covering: Dict[int, List[int]] = {}
+    for i, cube in enumerate(members):
+        for symbol in cube:
+            covering.setdefault(symbol, []).append(i)
+
+    chosen = {ids[0] for ids in covering.values() if len(ids) == 1}   # essential
+    uncovered = set(symbols)
+    for i in chosen:
+        uncovered -= members[i]
+    while uncovered:
+        best = max(
+            (i for i in range(len(primes)) if i not in chosen),
+            key=lambda i: (len(members[i] & uncovered), -bin(primes[i][1]).count("1")),
+        )
+        chosen.add(best)
+        uncovered -= members[best]
+    return _irredundant([primes[i] for i in chosen], width)
+
+
+def _expand(value: int, care: int, on: Set[int], width: int) -> Cube:
+    """Raise bits of the cube as long as it stays inside *on*."""
+    bits = care
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        if all(s in on for s in cube_members(value ^ bit, care, width)):
+            value &= ~bit
+            care &= ~bit
+    return value, care
+
+
+def _irredundant(cubes: List[Cube], width: int) -> List[Cube]:
+    """Drop cubes whose symbols are all covered by the remaining ones."""
+    members = {cube: list(cube_members(*cube, width)) for cube in cubes}
+    count = Counter(s for symbols in members.values() for s in symbols)
+    kept = []
+    for cube in sorted(cubes, key=lambda c: len(members[c])):
+        if all(count[s] > 1 for s in members[cube]):
+            for s in members[cube]:
+                count[s] -= 1
+        else:
+            kept.append(cube)
+    return kept
+
+
+def cube_cover(symbols: Iterable[int], width: int) -> List[Cube]:
+    """Cover the set *symbols* of *width*-bit labels by few cubes.
+
+    The result is minimal or near-minimal, exact (it matches precisely
+    *symbols*) and sorted.  A label containing every symbol is the single
+    cube ``(0, 0)``.
+    """
+    on = set(symbols)
+    if not on:
+        return []
+    if len(on) == 1 << width:
+        return [(0, 0)]
+    if len(on) <= EXACT_LIMIT:
+        return sorted(_select(prime_implicants(on, width), on, width))
+
+    cubes = []
+    covered: Set[int] = set()
+    for symbol in sorted(on):
+        if symbol not in covered:
+            cube = _expand(symbol, (1 << width) - 1, on, width)
+            cubes.append(cube)
+            covered.update(cube_members(*cube, width))
+    return sorted(_irredundant(cubes, width))
+
+
+def split_cover(symbols: Iterable[int], width: int) -> List[Cube]:
+    """Exact cover of *symbols* by recursive splitting on the highest bit.
+
+    When both halves are identical the bit is a don't-care.  Not minimal,
+    but linear in the number of symbols per bit, and a single cube for fully
+    wild-carded labels.
+    """
+    def cover(syms: frozenset, bit: int) -> List[Cube]:
+        if bit < 0 or len(syms) == 2 << bit:      # every label: all wild
+            return [(0, 0)]
+        if len(syms) == 1:
+            (value,) = syms
+            return [(value, (2 << bit) - 1)]
+        mask = 1 << bit
+        low = frozenset(x for x in syms if not x & mask)
+        high = frozenset(x & ~mask for x in syms if x & mask)
+        if low == high:
+            return cover(low, bit - 1)
+        cubes = [(v, c | mask) for v, c in cover(low, bit - 1)] if low else []
+        if high:
+            cubes += [(v | mask, c | mask) for v, c in cover(high, bit - 1)]
+        return cubes
+
+    return cover(frozenset(symbols), width - 1)
+
+
+class BitPermutation:
+    """Moves bit ``i`` of every symbol to bit ``perm[i]``.
+
+    The permutation is compiled into one lookup table per byte of the
+    symbol, so permuting a symbol costs a table lookup per 8 variables.
+    """
+
+    def __init__(self, perm: Sequence[int]):
+        if sorted(perm) != list(range(len(perm))):
+            raise ValueError(f"not a permutation: {list(perm)}")
+        self.perm = tuple(perm)
+        self.width = len(perm)
+        self._tables: List[List[int]] = []
+        for low in range(0, self.width, 8):
+            chunk = self.perm[low:low + 8]
+            table = [0] * (1 << len(chunk))
+            for byte in range(1, len(table)):
+                lowest = byte & -byte
+                table[byte] = table[byte ^ lowest] | 1 << chunk[lowest.bit_length() - 1]
+            self._tables.append(table)
+
+    @classmethod
+    def between(cls, old_order: Sequence[str], new_order: Optional[Sequence[str]]
+                ) -> "BitPermutation":
+        """The permutation taking labels over *old_order* to *new_order*."""
+        if new_order is None:
+            return cls(range(len(old_order)))
+        if sorted(new_order) != sorted(old_order):
+            raise ValueError("new_order must contain the same variables.")
+        position = {var: i for i, var in enumerate(new_order)}
+        return cls([position[var] for var in old_order])
+
+    @property
+    def is_identity(self) -> bool:
+        return all(i == p for i, p in enumerate(self.perm))
+
+    def __call__(self, symbol: int) -> int:
+        out = 0
+        for table in self._tables:
+            out |= table[symbol & 0xFF]
+            symbol >>= 8
+        return out
+
+    def apply(self, symbols: Iterable[int]) -> List[int]:
+        """Permute every symbol of *symbols*."""
+        if len(self._tables) == 1:
+            table = self._tables[0]
+            return [table[s] for s in symbols]
+        return [self(s) for s in symbols]
+
+    def cube(self, value: int, care: int) -> Cube:
+        return self(value), self(care)
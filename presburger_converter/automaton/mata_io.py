@@ -1,7 +1,9 @@
-from libmata import alphabets as alph, parser as mata_parser
-import tempfile
-import os
-from typing import Callable
+import libmata.nfa.nfa as mata_nfa
+import mmap
+from collections import defaultdict
+from typing import Callable, List, Optional, Tuple, Union
+
+from presburger_converter.automaton.labels import cube_members, split_cover
 
 def nfa_to_mata(
     aut,
@@ -25,34 +27,212 @@ def nfa_to_mata(
 
 def nfa_from_mata(mata_string):
     """
-    Parses a MATA automaton from a string by first saving it to a temporary file,
-    then reading it with the mata_parser, and finally deleting the temporary file.
+    Parses an @NFA-explicit automaton with integer symbols directly from memory.
+
+    States are always numbered densely from 0, so the size of the automaton
+    is bounded by the text.  Names of the form ``q<number>`` (as written by
+    `nfa_to_mata`) are numbered in the order of their numbers, which keeps
+    the numbering of automata whose states were already dense; any other
+    naming is numbered in order of appearance.
 
     Args:
-        mata_string (str): The MATA automaton definition as a string.
+        mata_string: The MATA automaton definition as ``str`` or as a bytes-like
+            object (``bytes``, ``memoryview``, ...) holding UTF-8 text.
 
     Returns:
-        The automaton object returned by mata_parser.from_mata.
+        A new ``mata_nfa.Nfa``.
     """
-    alpha = alph.IntAlphabet()
-    temp_file = None  # Initialize temp_file to None for the finally block
+    if not isinstance(mata_string, str):
+        mata_string = bytes(mata_string).decode("utf-8")
+
+    initial: List[str] = []
+    final: List[str] = []
+    transitions: List[Tuple[str, int, str]] = []
+    for lineno, line in enumerate(mata_string.splitlines(), 1):
+        parts = line.split()
+        if not parts or parts[0].startswith("#"):
+            continue
+        head = parts[0]
+        if head.startswith("@"):
+            if head != "@NFA-explicit":
+                raise ValueError(f"unsupported automaton type {head!r}")
+        elif head == "%Initial":
+            initial.extend(parts[1:])
+        elif head == "%Final":
+            final.extend(parts[1:])
+        elif head.startswith("%"):
+            continue                        # e.g. %Alphabet-auto
+        elif len(parts) == 3:
+            try:
+                transitions.append((parts[0], int(parts[1]), parts[2]))
+            except ValueError:
+                raise ValueError(f"line {lineno}: symbol {parts[1]!r} is not an integer")
+        else:
+            raise ValueError(f"line {lineno}: cannot parse {line!r}")
+
+    names = dict.fromkeys(initial)
+    names.update(dict.fromkeys(final))
+    for source, _, target in transitions:
+        names[source] = None
+        names[target] = None
+    if all(n[:1] == "q" and n[1:].isdigit() for n in names):
+        names = sorted(names, key=lambda n: int(n[1:]))
+    ids = {n: i for i, n in enumerate(names)}
+
+    aut = mata_nfa.Nfa(len(ids))
+    aut.initial_states = [ids[n] for n in initial]
+    aut.final_states = [ids[n] for n in final]
+    add = aut.add_transition
+    for source, symbol, target in transitions:
+        add(ids[source], symbol, ids[target])
+    return aut
+
+
+# ---------------------------------------------------------------------------
+# Compact binary format
+# ---------------------------------------------------------------------------
+#
+#   magic "PNFA" | version u8 | flags u8
+#   varint num_states
+#   varint n_initial, initial states (delta-encoded, ascending)
+#   varint n_final,   final states   (delta-encoded, ascending)
+#   plain:  per state: varint out-degree, then per transition sorted by
+#           (symbol, target): varint symbol delta, varint target
+#   cubes:  varint label width; per state: varint number of targets, then
+#           per target: varint target, varint n_cubes, (varint value,
+#           varint care-mask) per cube
+#
+# All integers are unsigned LEB128 varints.  State numbers are preserved.
 
-    try:
-        # Create a temporary file with a .mata extension
-        # NamedTemporaryFile ensures it has a name on the filesystem
-        # delete=False means we'll manually delete it in the finally block
-        # mode='w+' allows writing and reading, text=True for string content
-        with tempfile.NamedTemporaryFile(mode='w+', suffix=".mata", delete=False, encoding='utf-8') as temp_fp:
-            temp_fp.write(mata_string)
-            temp_file_path = temp_fp.name
+_BIN_MAGIC = b"PNFA"
+_BIN_VERSION = 1
+_FLAG_CUBES = 1
 
-        # The file is now written and closed, so mata_parser can read it
-        aut = mata_parser.from_mata(temp_file_path, alpha)
+BytesLike = Union[bytes, bytearray, memoryview, mmap.mmap]
 
+
+def _put_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _put_sorted(out: bytearray, values) -> None:
+    values = sorted(values)
+    _put_varint(out, len(values))
+    prev = 0
+    for v in values:
+        _put_varint(out, v - prev)
+        prev = v
+
+
+def nfa_to_bytes(aut, compress_labels: bool = False, width: Optional[int] = None) -> bytes:
+    """Return *aut* in the compact binary format.
+
+    With *compress_labels* the symbols of every (source, target) pair are
+    stored as label cubes over *width* bits (default: the bit length of the
+    largest symbol), which is much smaller for the 2^k-letter alphabets the
+    builder produces.
+    """
+    num_states = aut.num_of_states()
+    by_source = [[] for _ in range(num_states)]
+    for t in aut.get_trans_as_sequence():
+        by_source[t.source].append((t.symbol, t.target))
+
+    out = bytearray(_BIN_MAGIC)
+    out.append(_BIN_VERSION)
+    out.append(_FLAG_CUBES if compress_labels else 0)
+    _put_varint(out, num_states)
+    _put_sorted(out, aut.initial_states)
+    _put_sorted(out, aut.final_states)
+
+    if not compress_labels:
+        for post in by_source:
+            post.sort()
+            _put_varint(out, len(post))
+            prev = 0
+            for symbol, target in post:
+                _put_varint(out, symbol - prev)
+                _put_varint(out, target)
+                prev = symbol
+        return bytes(out)
+
+    if width is None:
+        width = max((s for post in by_source for s, _ in post), default=0).bit_length()
+    _put_varint(out, width)
+    for post in by_source:
+        targets = defaultdict(list)
+        for symbol, target in post:
+            targets[target].append(symbol)
+        _put_varint(out, len(targets))
+        for target in sorted(targets):
+            cubes = split_cover(targets[target], width)
+            _put_varint(out, target)
+            _put_varint(out, len(cubes))
+            for value, care in cubes:
+                _put_varint(out, value)
+                _put_varint(out, care)
+    return bytes(out)
+
+
+def nfa_from_bytes(data: BytesLike):
+    """Build an automaton from the binary format, directly in memory.
+
+    *data* may be any buffer, including a memoryview slice or an mmap.
+    """
+    buf = memoryview(data)
+    if bytes(buf[:4]) != _BIN_MAGIC or buf[4] != _BIN_VERSION:
+        raise ValueError("not a binary automaton (or unsupported version)")
+    flags = buf[5]
+    pos = 6
+
+    def varint() -> int:
+        nonlocal pos
+        result = shift = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def sorted_values() -> List[int]:
+        values, prev = [], 0
+        for _ in range(varint()):
+            prev += varint()
+            values.append(prev)
+        return values
+
+    num_states = varint()
+    aut = mata_nfa.Nfa(num_states)
+    aut.initial_states = sorted_values()
+    aut.final_states = sorted_values()
+    add = aut.add_transition
+
+    if not flags & _FLAG_CUBES:
+        for source in range(num_states):
+            symbol = 0
+            for _ in range(varint()):
+                symbol += varint()
+                add(source, symbol, varint())
         return aut
-    finally:
-        # Ensure the temporary file is deleted, even if an error occurred
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            # print(f"Temporary file '{temp_file_path}' deleted.") # Optional: for debugging
 
+    width = varint()
+    for source in range(num_states):
+        for _ in range(varint()):
+            target = varint()
+            for _ in range(varint()):
+                value = varint()
+                care = varint()
+                for symbol in cube_members(value, care, width):
+                    add(source, symbol, target)
+    return aut
+
+
+def nfa_from_file(path: str):
+    """Load a binary automaton file through a read-only memory map."""
+    with open(path, "rb") as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return nfa_from_bytes(mapped)
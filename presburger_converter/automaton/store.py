@@ -0,0 +1,154 @@
+# store.py
+"""
+Persistent, content-addressed store for compiled automata.
+
+Entries are keyed by a hash of the normalized formula, the package and
+libmata versions and the store format, and hold the minimized automaton
+in the compact binary format (label cubes over the variable bits) together
+with its variable order and some metadata.  The store is safe to
+share between worker processes: entries are written to a temporary file and
+atomically renamed into place, readers never see partial files, and a
+vanished or corrupt entry simply counts as a miss.  The total size is kept
+below ``max_bytes`` by evicting the least recently used entries.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+from importlib import metadata
+from typing import Any, Dict, List, Optional, Tuple
+
+from presburger_converter.automaton.automaton_builder import formula_key
+from presburger_converter.automaton.mata_io import nfa_from_bytes, nfa_to_bytes
+
+# Bump whenever the payload layout or the construction changes in a way that
+# makes previously stored automata invalid.
+STORE_FORMAT = 3
+_MAGIC = b"PAUT"
+_HEADER = struct.Struct("<4sHI")          # magic, format, metadata length
+
+
+def _version(dist: str) -> str:
+    try:
+        return metadata.version(dist)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class AutomatonStore:
+    """On-disk cache of minimized automata.
+
+    Parameters
+    ----------
+    directory : str
+        Where entries are kept; created if missing.
+    max_bytes : int
+        Size bound of all entries together (default 256 MiB).
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._salt = f"{_version('presburger_converter')}|{_version('libmata')}|{STORE_FORMAT}"
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Keys and paths
+    # ------------------------------------------------------------------
+
+    def key(self, normalized_tree, integers: bool = False) -> str:
+        """Return the key of a normalized formula AST.
+
+        The variable order of the resulting automaton is fully determined by
+        the normalized AST, so it needs no separate key component; automata
+        over ℤ (*integers*) are kept apart from those over ℕ.  The AST is
+        hashed in the canonical form of ``formula_key``.
+        """
+        domain = "\nZ" if integers else ""
+        text = formula_key(normalized_tree)
+        digest = hashlib.sha256(f"{self._salt}{domain}\n{text}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    # ------------------------------------------------------------------
+    # Access
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Tuple[Any, List[str], Dict[str, Any]]]:
+        """Return ``(aut, variables, metadata)`` or ``None`` on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return None
+        try:
+            magic, fmt, meta_len = _HEADER.unpack_from(data)
+            if magic != _MAGIC or fmt != STORE_FORMAT:
+                raise ValueError("foreign or outdated entry")
+            offset = _HEADER.size
+            meta = json.loads(data[offset:offset + meta_len])
+            aut = nfa_from_bytes(memoryview(data)[offset + meta_len:])
+        except Exception:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)                # mark as recently used
+        except OSError:
+            pass
+        return aut, meta.pop("variables"), meta
+
+    def put(self, key: str, aut, variables: List[str], **meta: Any) -> None:
+        """Store *aut* under *key*, then evict old entries if necessary."""
+        meta = {**meta, "variables": list(variables), "created": time.time()}
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        payload = nfa_to_bytes(aut, compress_labels=True, width=len(variables))
+        data = _HEADER.pack(_MAGIC, STORE_FORMAT, len(meta_bytes)) + meta_bytes + payload
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp_path, path)    # atomic, also across processes
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the size bound holds."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue              # evicted concurrently
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,356 @@
+# batch.py
+"""
+Compile many formulas at once, sharing the work they have in common.
+
+All inputs are parsed and normalized first.  The normalized formulas are then
+hash-consed into one DAG over the whole batch: structurally equal subformulas
+become a single node.  Every input formula and every node needed by more than
+one parent becomes a *task* whose automaton is built exactly once; all other
+nodes are built inline by the task above them.  A task is handed out as soon
+as the tasks below it are done and receives their automata as ``Prebuilt``
+leaves in the binary format, so tasks can run in separate processes.
+
+With a ``min_task_cost`` the operands of a disjunction become tasks of their
+own as well, provided both are estimated to cost at least that much, so the
+independent halves of one large formula are built in parallel while small
+atoms stay inline instead of being shipped to another process.
+
+:class:`BatchPlan` does the bookkeeping and is independent of how tasks are
+run; :func:`formulas_to_auts` drives it with a process pool and yields the
+results in completion order, and :func:`build_parallel` uses it for a single
+formula.
+"""
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from presburger_converter.parsing import expander, macro_preprocessor
+from presburger_converter.parsing.ast_nodes import Exists, LessEqual, Or
+from presburger_converter.automaton.automaton_builder import (
+    Prebuilt, atom_key, count_tree, formula_children, with_children,
+)
+from presburger_converter.automaton.mata_io import nfa_from_bytes
+
+# Default min_task_cost of build_parallel: operands estimated below this many
+# transitions are cheaper to build than to send to another process.
+PARALLEL_MIN_COST = 1 << 15
+
+
+def atom_cost(node: LessEqual) -> int:
+    """Rough size of the automaton of an atom: carries times letters."""
+    constant, coeffs = count_tree(node)
+    return (sum(abs(c) for c in coeffs.values()) + abs(constant) + 1) << len(coeffs)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one input formula; exactly one of *aut* and *error* is set."""
+    index: int
+    formula: str
+    aut: Any = None
+    variables: Optional[List[str]] = None
+    error: Optional[BaseException] = None
+
+
+class _Task:
+    __slots__ = ("node_id", "deps", "parents", "inputs", "waiting", "raw", "variables",
+                 "failed")
+
+    def __init__(self, node_id: int):
+        self.node_id = node_id
+        self.deps: List["_Task"] = []        # tasks whose automata this one needs
+        self.parents: List["_Task"] = []     # tasks that need this one
+        self.inputs: List[int] = []          # indices of inputs this task answers
+        self.waiting = 0                     # deps not finished yet
+        self.raw: Optional[bytes] = None     # unminimized automaton, for parents
+        self.variables: Optional[List[str]] = None
+        self.failed = False                  # a dep (or the task itself) failed
+
+
+class BatchPlan:
+    """Dependency-ordered construction plan of a batch of formulas.
+
+    Results that need no construction (syntax errors, hits in *store*) are
+    available in :attr:`immediate`.  With *min_task_cost*, both operands of
+    every disjunction are split off as tasks if both reach that estimated
+    cost (the sum of :func:`atom_cost` over their atoms).  Afterwards the driver repeatedly takes
+    the tasks returned by :meth:`ready`, runs ``fn(*args)`` of :meth:`job` on
+    them and reports back with :meth:`complete` or :meth:`fail`, both of
+    which return the input results that became final.
+    """
+
+    def __init__(self, inputs: Iterable[str], store=None,
+                 limits: Optional[Dict[str, Any]] = None,
+                 min_task_cost: Optional[int] = None):
+        self.formulas = list(inputs)
+        self.store = store
+        self.limits = limits
+        self.immediate: List[BatchResult] = []
+
+        self._keys: Dict[Tuple, int] = {}            # structure -> node id
+        self._nodes: List[Any] = []                  # node id -> AST node
+        self._children: List[Tuple[int, ...]] = []   # node id -> child ids
+        self._parents: List[Set[int]] = []           # node id -> parent ids
+        self._cost: List[int] = []                   # node id -> estimated cost
+        self._memo: Dict[int, int] = {}              # id(AST node) -> node id, per input
+
+        roots: Dict[int, List[int]] = {}             # node id -> input indices
+        self._store_keys: Dict[int, str] = {}
+        for index, formula in enumerate(self.formulas):
+            try:
+                tree = expander.process_syntax_tree(macro_preprocessor.process_macros(formula))
+                # Ids are only unique among live objects, so the memo must
+                # not outlive the tree it was filled from.
+                self._memo.clear()
+                node_id = self._intern(tree)
+            except Exception as exc:
+                self.immediate.append(BatchResult(index, formula, error=exc))
+                continue
+            if store is not None:
+                key = store.key(tree)
+                hit = store.get(key)
+                if hit is not None:
+                    aut, variables, _ = hit
+                    self.immediate.append(BatchResult(index, formula, aut, variables))
+                    continue
+                self._store_keys[node_id] = key
+            roots.setdefault(node_id, []).append(index)
+
+        self._roots = set(roots)
+        self._split: Set[int] = set()
+        if min_task_cost is not None:
+            for node_id, node in enumerate(self._nodes):
+                if isinstance(node, Or):
+                    left, right = self._children[node_id]
+                    if min(self._cost[left], self._cost[right]) >= min_task_cost:
+                        self._split.update((left, right))
+        self._tasks: Dict[int, _Task] = {}
+        for node_id, indices in roots.items():
+            self._task(node_id).inputs.extend(indices)
+        self._ready = deque(t for t in self._tasks.values() if t.waiting == 0)
+        self._open = len(self._tasks)
+
+    # ------------------------------------------------------------------
+    # Building the DAG
+    # ------------------------------------------------------------------
+
+    def _intern(self, node) -> int:
+        """Return the id of *node*, adding it (and its subformulas) if new."""
+        memo = self._memo.get(id(node))
+        if memo is not None:
+            return memo
+        children = tuple(self._intern(child)
+                         for child in formula_children(node, "BatchPlan._intern"))
+        if isinstance(node, LessEqual):
+            key: Tuple = ("LessEqual", atom_key(node))
+        elif isinstance(node, Exists):
+            key = ("Exists", str(node.var)) + children
+        else:
+            key = (type(node).__name__,) + children
+
+        node_id = self._keys.get(key)
+        if node_id is None:
+            node_id = self._keys[key] = len(self._nodes)
+            self._nodes.append(node)
+            self._children.append(children)
+            self._parents.append(set())
+            self._cost.append(atom_cost(node) if isinstance(node, LessEqual)
+                              else sum(self._cost[child] for child in children))
+            for child in children:
+                self._parents[child].add(node_id)
+        self._memo[id(node)] = node_id
+        return node_id
+
+    def _is_task(self, node_id: int) -> bool:
+        return (node_id in self._roots or len(self._parents[node_id]) > 1
+                or node_id in self._split)
+
+    def _task(self, node_id: int) -> _Task:
+        """Return the task of *node_id*, creating it and the tasks below it."""
+        task = self._tasks.get(node_id)
+        if task is not None:
+            return task
+        task = self._tasks[node_id] = _Task(node_id)
+        stack = list(self._children[node_id])
+        seen: Set[int] = set()
+        while stack:
+            child = stack.pop()
+            if child in seen:
+                continue
+            seen.add(child)
+            if self._is_task(child):
+                dep = self._task(child)
+                task.deps.append(dep)
+                dep.parents.append(task)
+                if dep.raw is None:
+                    task.waiting += 1
+            else:
+                stack.extend(self._children[child])
+        return task
+
+    def _body(self, node_id: int, top: bool = True):
+        """The AST of a task with the automata of its deps as leaves."""
+        if not top and node_id in self._tasks:
+            dep = self._tasks[node_id]
+            return Prebuilt(dep.raw, dep.variables)
+        children = [self._body(child, False) for child in self._children[node_id]]
+        return with_children(self._nodes[node_id], children)
+
+    # ------------------------------------------------------------------
+    # Driving
+    # ------------------------------------------------------------------
+
+    @property
+    def done(self) -> bool:
+        return self._open == 0
+
+    @property
+    def num_tasks(self) -> int:
+        return len(self._tasks)
+
+    def ready(self) -> List[_Task]:
+        """Tasks whose dependencies are done; each is returned only once."""
+        tasks = list(self._ready)
+        self._ready.clear()
+        return tasks
+
+    def job(self, task: _Task) -> Tuple[Callable[..., Dict[str, Any]], tuple]:
+        """``(fn, args)`` computing *task*; *fn* is importable by workers."""
+        return build_task, (self._body(task.node_id), bool(task.inputs),
+                            bool(task.parents), self.limits)
+
+    def complete(self, task: _Task, result: Dict[str, Any]) -> List[BatchResult]:
+        task.raw = result.get("aut")
+        task.variables = result["variables"]
+        self._open -= 1
+        for parent in task.parents:
+            parent.waiting -= 1
+            if parent.waiting == 0 and not parent.failed:
+                self._ready.append(parent)
+        if not task.inputs:
+            return []
+        key = self._store_keys.get(task.node_id)
+        if key is not None:
+            self.store.put(key, nfa_from_bytes(result["aut_min"]), task.variables)
+        # Every input gets an automaton of its own, as from formula_to_aut.
+        return [BatchResult(i, self.formulas[i], nfa_from_bytes(result["aut_min"]),
+                            list(task.variables))
+                for i in task.inputs]
+
+    def fail(self, task: _Task, exc: BaseException) -> List[BatchResult]:
+        """Mark *task* and everything depending on it as failed with *exc*.
+
+        Tasks that already failed through another dependency are skipped, so
+        every input is reported once.
+        """
+        results = []
+        stack = [task]
+        while stack:
+            t = stack.pop()
+            if t.failed:
+                continue
+            t.failed = True
+            self._open -= 1
+            results.extend(BatchResult(i, self.formulas[i], error=exc) for i in t.inputs)
+            stack.extend(t.parents)
+        return results
+
+
+def build_task(node, minimize: bool, keep_raw: bool,
+               limits: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Build the automaton of one batch task (runs in a worker).
+
+    Returns its variables and, as requested, the unminimized automaton (for
+    the tasks above) and the minimized one (for an input formula), both in
+    the binary format.
+    """
+    import libmata.nfa.nfa as mata_nfa
+    from presburger_converter.automaton.automaton_builder import build_automaton
+    from presburger_converter.automaton.budget import Budget, check, check_automaton
+    from presburger_converter.automaton.mata_io import nfa_to_bytes
+
+    budget = Budget(**limits) if limits else None
+    aut, variables = build_automaton(node, budget=budget)
+    width = len(variables)
+    result: Dict[str, Any] = {"variables": variables}
+    if keep_raw:
+        result["aut"] = nfa_to_bytes(aut, compress_labels=True, width=width)
+    if minimize:
+        aut.get_reachable_states()
+        check(budget)
+        aut_min = mata_nfa.minimize(aut)
+        check_automaton(budget, aut_min)
+        result["aut_min"] = nfa_to_bytes(aut_min, compress_labels=True, width=width)
+    return result
+
+
+def formulas_to_auts(inputs: Iterable[str], processes: Optional[int] = None,
+                     store=None, limits: Optional[Dict[str, Any]] = None,
+                     min_task_cost: Optional[int] = None) -> Iterator[BatchResult]:
+    """Compile every formula of *inputs*; yield a :class:`BatchResult` each.
+
+    Results come in completion order (see ``BatchResult.index``).  The
+    automata are the minimized ones ``formula_to_aut`` returns.  *processes*
+    is the number of worker processes (default: number of CPUs; 0 builds
+    everything in this process).  *store* is an optional ``AutomatonStore``
+    and *limits* the keyword arguments of a ``Budget`` applied per task;
+    *min_task_cost* also splits large disjunctions (see :class:`BatchPlan`).
+    """
+    plan = BatchPlan(inputs, store, limits, min_task_cost)
+    yield from plan.immediate
+    yield from _run(plan, processes)
+
+
+def build_parallel(formula: str, processes: Optional[int] = None,
+                   min_task_cost: int = PARALLEL_MIN_COST,
+                   limits: Optional[Dict[str, Any]] = None):
+    """Build the minimized automaton of *formula*; return ``(aut, variables)``.
+
+    Independent operands of disjunctions (and of the Boolean combinations
+    normalized into them) whose estimated cost reaches *min_task_cost* are
+    built in parallel by *processes* worker processes and passed on in the
+    binary format.  If nothing is worth splitting no pool is started.
+    Errors are raised as by ``formula_to_aut``.
+    """
+    plan = BatchPlan([formula], limits=limits, min_task_cost=min_task_cost)
+    if plan.num_tasks <= 1:
+        processes = 0
+    for result in itertools.chain(plan.immediate, _run(plan, processes)):
+        if result.error is not None:
+            raise result.error
+        return result.aut, result.variables
+
+
+def _run(plan: BatchPlan, processes: Optional[int]) -> Iterator[BatchResult]:
+    """Run the tasks of *plan* and yield the results of its inputs."""
+    if processes == 0:
+        while not plan.done:
+            for task in plan.ready():
+                fn, args = plan.job(task)
+                try:
+                    result = fn(*args)
+                except Exception as exc:
+                    yield from plan.fail(task, exc)
+                else:
+                    yield from plan.complete(task, result)
+        return
+
+    with ProcessPoolExecutor(processes, mp_context=mp.get_context("spawn")) as executor:
+        running = {}
+        while not plan.done:
+            for task in plan.ready():
+                fn, args = plan.job(task)
+                running[executor.submit(fn, *args)] = task
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    yield from plan.fail(task, exc)
+                else:
+                    yield from plan.complete(task, future.result())
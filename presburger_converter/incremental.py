@@ -0,0 +1,182 @@
+# incremental.py
+"""
+Recompile edited formulas, reusing the automata of unchanged subformulas.
+
+An editor sends the whole formula again after every change, although
+usually only one atom or connective differs.  A :class:`SubformulaCache`
+keeps the unminimized automaton of every subformula compiled through it,
+keyed by a hash of the normalized subformula (which also fixes its variable
+order).  :func:`build_incremental` looks the nodes of a new normalized
+formula up from the root down: a node found in the cache becomes a
+``Prebuilt`` leaf, and only the remaining nodes -- the spine from the edited
+parts up to the root -- are built, one at a time, so that each of them below
+the root is cached for the next edit.
+
+Entries are automata of this process, copied for every use, or automata in
+the binary format when they come from or go to another process:
+:meth:`SubformulaCache.reusable` selects the entries a formula can use, so
+that only those are sent to the worker compiling it, and
+:meth:`SubformulaCache.serialized` returns what the worker built.  The cache
+is bounded by the size of its entries and drops the least recently used
+ones first.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from presburger_converter.automaton.automaton_builder import (
+    Prebuilt, atom_key, build_automaton, formula_children, with_children,
+)
+from presburger_converter.automaton.mata_io import nfa_to_bytes
+from presburger_converter.parsing import expander, macro_preprocessor
+from presburger_converter.parsing.ast_nodes import Exists, LessEqual
+
+# (automaton or its binary format, variables)
+Entry = Tuple[Any, List[str]]
+
+
+def _size(data) -> int:
+    """Bytes taken by an entry; estimated for automata not in binary format."""
+    if isinstance(data, bytes):
+        return len(data)
+    return 8 * (data.num_of_states() + data.get_num_of_transitions())
+
+
+def subformula_keys(tree, integers: bool = False) -> Dict[int, str]:
+    """Key of every node of the normalized *tree*, by ``id`` of the node.
+
+    Keys are hashes over the node and the keys of its children, so they are
+    computed in one pass; atoms enter as their ``atom_key``.
+    Automata over ℤ (*integers*) get keys of their own.
+    """
+    keys: Dict[int, str] = {}
+
+    def visit(node) -> str:
+        key = keys.get(id(node))
+        if key is not None:
+            return key
+        children = [visit(child) for child in formula_children(node, "subformula_keys")]
+        if isinstance(node, LessEqual):
+            label = f"{'Z' if integers else 'N'} {atom_key(node)}"
+        elif isinstance(node, Exists):
+            label = f"Exists {node.var}"
+        else:
+            label = type(node).__name__
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update("\n".join([label, *children]).encode("utf-8"))
+        key = keys[id(node)] = digest.hexdigest()
+        return key
+
+    visit(tree)
+    return keys
+
+
+class SubformulaCache:
+    """Thread-safe LRU map from subformula keys to ``(automaton, variables)``.
+
+    Parameters
+    ----------
+    max_bytes : int or None
+        Size bound of all automata together (default 16 MiB); ``None``
+        keeps everything.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = 16 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries: OrderedDict[str, Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def items(self) -> List[Tuple[str, Entry]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, data, variables: List[str]) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= _size(old[0])
+            self._entries[key] = (data, list(variables))
+            self.nbytes += _size(data)
+            while self.max_bytes is not None and self.nbytes > self.max_bytes:
+                _, (dropped, _) = self._entries.popitem(last=False)
+                self.nbytes -= _size(dropped)
+
+    def update(self, entries: Dict[str, Entry]) -> None:
+        for key, (data, variables) in entries.items():
+            self.put(key, data, variables)
+
+    def serialized(self, skip: Collection[str] = ()) -> Dict[str, Entry]:
+        """All entries but those in *skip*, in the binary format."""
+        return {
+            key: (data if isinstance(data, bytes) else
+                  nfa_to_bytes(data, compress_labels=True, width=len(variables)),
+                  variables)
+            for key, (data, variables) in self.items() if key not in skip
+        }
+
+    def reusable(self, formula: str, integers: bool = False) -> Dict[str, Entry]:
+        """The entries of the largest subformulas of *formula* in the cache.
+
+        A formula that does not parse selects nothing; compiling it reports
+        the error.
+        """
+        try:
+            tree = expander.process_syntax_tree(macro_preprocessor.process_macros(formula))
+            keys = subformula_keys(tree, integers)
+        except Exception:
+            return {}
+        selection: Dict[str, Entry] = {}
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            entry = self.get(keys[id(node)])
+            if entry is not None:
+                selection[keys[id(node)]] = entry
+            else:
+                stack.extend(formula_children(node))
+        return selection
+
+
+def _with_leaves(node, leaf):
+    """*node* with its children replaced by ``leaf(child)``."""
+    return with_children(node, [leaf(child) for child in formula_children(node)])
+
+
+def build_incremental(tree, cache: SubformulaCache, mode="determinize", trace=None,
+                      budget=None, integers=False):
+    """Build the automaton of the normalized *tree* like ``build_automaton``.
+
+    Subformulas found in *cache* are taken from there; every other node
+    below the root is built on its own and added to *cache*.
+    """
+    keys = subformula_keys(tree, integers)
+
+    def leaf(node) -> Prebuilt:
+        key = keys[id(node)]
+        entry = cache.get(key)
+        if entry is None:
+            entry = build_automaton(_with_leaves(node, leaf), mode, trace, budget, integers)
+            cache.put(key, *entry)
+        return Prebuilt(*entry)
+
+    entry = cache.get(keys[id(tree)])
+    if entry is not None:
+        return build_automaton(Prebuilt(*entry), mode, trace, budget, integers)
+    return build_automaton(_with_leaves(tree, leaf), mode, trace, budget, integers)
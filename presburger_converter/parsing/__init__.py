@@ -1,9 +1,7 @@
-from .macro_preprocessor import process_macros
-from .parser import parse_formula
-from .expander import expand_shorthands
+from presburger_converter._lazy import attach
 
-__all__ = [
-    "process_macros",
-    "parse_formula",
-    "expand_shorthands"
-]
\ No newline at end of file
+__getattr__, __dir__, __all__ = attach(__name__, {
+    "process_macros": ".macro_preprocessor",
+    "parse_formula": ".parser",
+    "expand_shorthands": ".expander",
+})
\ No newline at end of file
@@ -131,4 +131,12 @@ class ForAll:
         self.var = var
         self.formula = formula
     def __repr__(self):
-        return f"ForAll({self.var}, {self.formula})"
\ No newline at end of file
+        return f"ForAll({self.var}, {self.formula})"
+
+# Macro calls only exist between parsing and macro expansion
+class MacroCall:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+    def __repr__(self):
+        return f"{self.name}({', '.join(map(repr, self.args))})"
\ No newline at end of file
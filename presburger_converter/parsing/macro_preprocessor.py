@@ -1,15 +1,23 @@
 # macro_preprocessor.py
 """
-Collects user-defined macros, checks them, expands them recursively and
-returns the expanded formula as a string.
+Collects user-defined macros, checks them and expands them.
+
+Every macro body is parsed exactly once into an AST *template* in which all
+calls to earlier macros are already inlined.  A call is then instantiated by
+substituting the argument ASTs for the formal parameters; subtrees of the
+template that do not mention a parameter, and the argument subtrees
+themselves, are shared rather than copied.  The result is the expanded
+formula as an AST, ready for the expander – it is never re-parsed.
 """
 from __future__ import annotations
 import re
 from dataclasses import dataclass
 from collections import OrderedDict
-from typing import Mapping, Sequence
+from itertools import count
+from typing import Any, Mapping, Sequence
 
 # --- Project imports --------------------------------------------------------
+from presburger_converter.parsing.ast_nodes import *
 from presburger_converter.parsing.parser import parse_formula, UnexpectedInput
 from presburger_converter.parsing.utils import _free_vars
 
@@ -19,7 +27,7 @@ from presburger_converter.parsing.utils import _free_vars
 class Macro:
     name: str
     params: tuple[str, ...]
-    body_src: str
+    body: Any
 
 
 # ---------------------------------------------------------------------------
@@ -34,7 +42,8 @@ _header_rx = re.compile(
     re.X,
 )
 
-_call_rx = re.compile(r"\b([A-Za-z]\w*)\s*\(")
+_BINARY = (Add, Sub, LessEqual, Eq, Less, Greater, GreaterEqual, NotEqual,
+           Or, And, Implies, Iff)
 
 
 def _split_lines(text: str) -> list[str]:
@@ -48,83 +57,130 @@ def _split_lines(text: str) -> list[str]:
     return result
 
 
-def _parse_parenthesised_args(src: str, open_idx: int) -> tuple[list[str], int]:
+def _scale(n: int, term):
+    """Return the term ``n * term`` for an argument substituted into ``n x``.
+
+    Products are folded and distributed over sums, so ``Mult.var`` stays a
+    variable name and ``2x`` with ``x := 3y`` is ``6y``, never a nested
+    product.
+    """
+    if isinstance(term, Var):
+        return Mult(n, term.name)
+    if isinstance(term, Mult):
+        return Mult(n * term.n, term.var)
+    if isinstance(term, Const):
+        return Const(n * term.value)
+    if isinstance(term, One):
+        return Const(n)
+    if isinstance(term, Zero):
+        return term
+    if isinstance(term, (Add, Sub)):
+        return type(term)(_scale(n, term.left), _scale(n, term.right))
+    raise ValueError(f"Unknown term type: {type(term)}")
+
+
+def _substitute(node, env: Mapping[str, Any], fresh):
     """
-    Given the index of the opening '(' in *src*, return (args, idx_after_closing_paren).
+    Replace the free variables named in *env* by their argument terms.
 
-    Splits top-level commas only; nested parens are handled.
+    Returns *node* itself when nothing below it changes, so unchanged
+    subtrees are shared between the template and every instantiation.
     """
-    depth = 0
-    last = open_idx + 1         # char after '('
-    args: list[str] = []
-    i = last
-    while i < len(src):
-        ch = src[i]
-        if ch == "(":
-            depth += 1
-        elif ch == ")":
-            if depth == 0:
-                args.append(src[last:i].strip())
-                return args, i + 1
-            depth -= 1
-        elif ch == "," and depth == 0:
-            args.append(src[last:i].strip())
-            last = i + 1
-        i += 1
-    raise SyntaxError("unbalanced parentheses while reading macro call")
-
-
-def _expand(src: str, macros: Mapping[str, Macro], stack: tuple[str, ...] = ()) -> str:
+    if not env:
+        return node
+
+    if isinstance(node, Var):
+        return env.get(node.name, node)
+
+    if isinstance(node, Mult):
+        return _scale(node.n, env[node.var]) if node.var in env else node
+
+    if isinstance(node, (Zero, One, Const)):
+        return node
+
+    if isinstance(node, _BINARY):
+        left = _substitute(node.left, env, fresh)
+        right = _substitute(node.right, env, fresh)
+        if left is node.left and right is node.right:
+            return node
+        return type(node)(left, right)
+
+    if isinstance(node, Not):
+        expr = _substitute(node.expr, env, fresh)
+        return node if expr is node.expr else Not(expr)
+
+    if isinstance(node, (Exists, ForAll)):
+        var = str(node.var)
+        inner_env = {k: v for k, v in env.items() if k != var}
+        if not inner_env:
+            return node
+        formula = node.formula
+        # Avoid capturing a variable of an argument: rename the bound one.
+        if any(var in _free_vars(arg) for arg in inner_env.values()):
+            new_var = fresh(var)
+            formula = _substitute(formula, {var: Var(new_var)}, fresh)
+            var = new_var
+        body = _substitute(formula, inner_env, fresh)
+        if body is node.formula and var == str(node.var):
+            return node
+        return type(node)(var, body)
+
+    raise ValueError(f"Unknown node type: {type(node)}")
+
+
+def _expand(node, macros: Mapping[str, Macro], fresh):
     """
-    Recursively expand every macro call found in *src*.
+    Replace every `MacroCall` below *node* by the instantiated macro body.
     """
-    out = []
-    i = 0
-    while i < len(src):
-        m = _call_rx.search(src, i)
-        if not m:
-            out.append(src[i:])
-            break
+    if isinstance(node, MacroCall):
+        if node.name not in macros:
+            raise UnexpectedInput(f"unknown macro '{node.name}'")
+        macro = macros[node.name]
+        if len(node.args) != len(macro.params):
+            raise UnexpectedInput(
+                f"macro '{node.name}' expects {len(macro.params)} args, got {len(node.args)}"
+            )
+        # Templates never contain calls, so only the arguments need expanding.
+        args = [_expand(arg, macros, fresh) for arg in node.args]
+        return _substitute(macro.body, dict(zip(macro.params, args)), fresh)
 
-        name = m.group(1)
-        # copy text *before* the call
-        out.append(src[i : m.start()])
-        i = m.end() - 1                    # position of '('
+    if isinstance(node, _BINARY):
+        left = _expand(node.left, macros, fresh)
+        right = _expand(node.right, macros, fresh)
+        if left is node.left and right is node.right:
+            return node
+        return type(node)(left, right)
 
-        if name not in macros:
-            # not a macro, just copy the original token *including its '('*
-            out.append(src[m.start():m.end()])  # "OR (" , "AND (" , etc.
-            i = m.end()  # <-- **add this line**
-            continue
+    if isinstance(node, Not):
+        expr = _expand(node.expr, macros, fresh)
+        return node if expr is node.expr else Not(expr)
+
+    if isinstance(node, (Exists, ForAll)):
+        formula = _expand(node.formula, macros, fresh)
+        return node if formula is node.formula else type(node)(node.var, formula)
+
+    return node
 
-        args, i = _parse_parenthesised_args(src, i)
-        macro = macros[name]
-        if len(args) != len(macro.params):
-            raise UnexpectedInput(
-                f"macro '{name}' expects {len(macro.params)} args, got {len(args)}"
-            )
 
-        # === positional substitution =======================================
-        # 1.  Pure textual replacement of the *formal* names by the *actual*
-        #     argument strings – no extra parens here!
-        subst = macro.body_src
-        for formal, actual in zip(macro.params, args):
-            subst = re.sub(rf"\b{re.escape(formal)}\b", actual, subst)
+def _fresh_names(taken: set[str]):
+    """Return a generator of variable names that do not occur in *taken*."""
+    counter = count(1)
 
-        # 2.  Recursively expand any macro calls *inside* that text.
-        expanded_body = _expand(subst, macros, stack + (name,))
+    def fresh(base: str) -> str:
+        while True:
+            name = f"{base}_{next(counter)}"
+            if name not in taken:
+                taken.add(name)
+                return name
 
-        # 3.  Finally wrap the ENTIRE replacement in one pair of parentheses
-        #     so the caller always receives a syntactically atomic formula.
-        out.append(f"({expanded_body})")
-    return "".join(out)
+    return fresh
 
 
 # ---------------------------------------------------------------------------
 # Main procedure
 # ---------------------------------------------------------------------------
 
-def _collect_macros(lines: Sequence[str]) -> tuple[OrderedDict[str, Macro], int]:
+def _collect_macros(lines: Sequence[str], fresh) -> tuple[OrderedDict[str, Macro], int]:
     """
     Scan *lines* from the top, collect macro definitions.
     Returns (macros_dict, index_of_first_non_macro_line).
@@ -145,10 +201,9 @@ def _collect_macros(lines: Sequence[str]) -> tuple[OrderedDict[str, Macro], int]
         if name in macros:
             raise SyntaxError(f"duplicate macro '{name}' (line {idx+1})")
 
-        # expand RHS using *earlier* macros only
-        expanded_rhs = _expand(rhs, macros)
+        # parse the RHS once and inline calls to *earlier* macros only
         try:
-            ast_rhs = parse_formula(expanded_rhs)
+            ast_rhs = _expand(parse_formula(rhs), macros, fresh)
         except UnexpectedInput as e:
             raise UnexpectedInput(
                 f"Inside macro '{name}' (line {idx+1}):\n{e}"
@@ -161,7 +216,7 @@ def _collect_macros(lines: Sequence[str]) -> tuple[OrderedDict[str, Macro], int]
                 f"(line {idx+1})"
             )
 
-        macros[name] = Macro(name, params, rhs.strip())
+        macros[name] = Macro(name, params, ast_rhs)
     else:
         # all lines were macros
         idx += 1
@@ -169,17 +224,20 @@ def _collect_macros(lines: Sequence[str]) -> tuple[OrderedDict[str, Macro], int]
 
 
 def process_macros(user_input):
+    """Parse *user_input* (macro definitions followed by the formula) and
+    return the formula's AST with every macro call expanded."""
     lines = _split_lines(user_input)
     if not lines:
         raise UnexpectedInput("Empty input")
 
-    macros, start_idx = _collect_macros(lines)
+    # Fresh names for renamed bound variables must not clash with any
+    # identifier the user wrote.
+    fresh = _fresh_names(set(re.findall(r"[A-Za-z]\w*", user_input)))
+    macros, start_idx = _collect_macros(lines, fresh)
 
     # The remaining lines form the actual formula.
     formula_src = "\n".join(lines[start_idx:])
     if not formula_src:
         raise UnexpectedInput("No formula line found after macro definitions")
 
-    expanded_formula = _expand(formula_src, macros)
-    #print(f"Expanded formula:\n{expanded_formula}\n")
-    return expanded_formula
\ No newline at end of file
+    return _expand(parse_formula(formula_src), macros, fresh)
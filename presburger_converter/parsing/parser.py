@@ -1,20 +1,11 @@
 # parser.py
 
+from functools import lru_cache
 from lark import Lark, Transformer, v_args, Token
 from presburger_converter.parsing.ast_nodes import *
 from lark import UnexpectedInput
 import os
 
-from presburger_converter.parsing.syntax_tree_visualizier import syntax_tree_to_dot, lark_tree_to_dot
-
-# Load grammar
-grammar_path = os.path.join(os.path.dirname(__file__), "grammar.lark")
-with open(grammar_path) as file:
-    grammar = file.read()
-
-parser = Lark(grammar, start="start")
-
-# parser.py
 
 @v_args(inline=True)
 class ASTTransformer(Transformer):
@@ -81,10 +72,36 @@ class ASTTransformer(Transformer):
     def parent(self, expr):
         return expr
 
+    def macro_call(self, name, *args):
+        return MacroCall(str(name), list(args))
+
     # ────────────────────────────── pass-through helpers ──────────────────────────
     def term(self, expr):     return expr          # if a ‘term’ is just a ‘sum’
     def sum(self, expr):      return expr          # if a ‘sum’ is just a ‘product’
     def product(self, expr):  return expr          # if a ‘product’ is just a ‘factor’
+    def start(self, expr):    return expr
+
+
+grammar_path = os.path.join(os.path.dirname(__file__), "grammar.lark")
+
+
+@lru_cache(maxsize=None)
+def get_parser() -> Lark:
+    """Build the parser on first use.
+
+    The LALR tables are cached on disk by lark (keyed by the grammar text and
+    lark version), so only the first process ever pays for the grammar
+    analysis.  The AST is built while parsing, no separate pass.
+    """
+    with open(grammar_path) as file:
+        grammar = file.read()
+    return Lark(
+        grammar,
+        start="start",
+        parser="lalr",
+        transformer=ASTTransformer(),
+        cache=True,
+    )
 
 
 def visualize_whitespace(line: str) -> str:
@@ -99,9 +116,7 @@ def visualize_whitespace(line: str) -> str:
 # Main parser function
 def parse_formula(formula):
     try:
-        tree = parser.parse(formula)
-        ast = ASTTransformer().transform(tree)
-        return ast
+        return get_parser().parse(formula)
     except UnexpectedInput as e:
         # Get raw line and caret context
         context = e.get_context(formula)
@@ -2,7 +2,12 @@
 
 from __future__ import annotations
 from typing import Any
-from graphviz import Digraph
+try:
+    from graphviz import Digraph
+except ImportError as exc:  # optional dependency
+    raise ImportError(
+        "Rendering syntax trees requires graphviz: pip install presburger_converter[viz]"
+    ) from exc
 from lark import Tree, Token
 
 __all__ = ["syntax_tree_to_dot", "lark_tree_to_dot"]
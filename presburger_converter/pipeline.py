@@ -1,43 +1,85 @@
-from doctest import UnexpectedException
-
-from presburger_converter.parsing import parser, expander, macro_preprocessor
+from presburger_converter.parsing import expander, macro_preprocessor
 from presburger_converter.automaton.automaton_builder import build_automaton, is_deterministic, determinize
+from presburger_converter.automaton.budget import check, check_automaton
+from presburger_converter.incremental import build_incremental
 import libmata.nfa.nfa as mata_nfa
 
 from presburger_converter.parsing.ast_nodes import LessEqual
+from presburger_converter.profiling import stage
 from lark import UnexpectedInput
 
 
 
-def formula_to_aut(user_input, display_atomic_construction=False):
-    formula = macro_preprocessor.process_macros(user_input)
-    tree = parser.parse_formula(formula)
-    pure_tree = expander.process_syntax_tree(tree)
-    #pure_tree = expander.expand_shorthands(tree)
-    aut, variables = build_automaton(pure_tree)
+def formula_to_aut(user_input, display_atomic_construction=False, trace=None, store=None, budget=None,
+                   integers=False, subformulas=None):
+    """Compile *user_input* into ``(minimized automaton, automaton, variables)``.
+
+    Pass a :class:`~presburger_converter.profiling.ConstructionTrace` as
+    *trace* to record the time spent in every stage of the pipeline, and an
+    :class:`~presburger_converter.automaton.store.AutomatonStore` as *store*
+    to reuse minimized automata compiled earlier (by any process).  A
+    :class:`~presburger_converter.automaton.budget.Budget` bounds the
+    construction and raises ``BudgetExceeded`` when it runs over.  With
+    *integers* the variables range over ℤ instead of ℕ (see
+    :func:`~presburger_converter.automaton.automaton_builder.build_automaton`).
+    A :class:`~presburger_converter.incremental.SubformulaCache` as
+    *subformulas* reuses the automata of subformulas compiled through it
+    before and records those built now, so that recompiling an edited
+    formula only builds what changed.
+    """
+    with stage(trace, "parse"):
+        tree = macro_preprocessor.process_macros(user_input)
+    with stage(trace, "normalize"):
+        pure_tree = expander.process_syntax_tree(tree)
+    key = None
+    if store is not None and not display_atomic_construction:
+        with stage(trace, "store_lookup"):
+            key = store.key(pure_tree, integers)
+            hit = store.get(key)
+        if hit is not None:
+            aut, variables, _ = hit
+            return aut, aut, variables
+    with stage(trace, "construction"):
+        if subformulas is not None and not display_atomic_construction:
+            aut, variables = build_incremental(pure_tree, subformulas, trace=trace, budget=budget,
+                                               integers=integers)
+        else:
+            aut, variables = build_automaton(pure_tree, trace=trace, budget=budget, integers=integers)
     aut.get_reachable_states()
     if display_atomic_construction:
         if isinstance(tree, LessEqual):
-            aut_minimized = mata_nfa.minimize(aut)
+            with stage(trace, "minimize"):
+                check(budget)
+                aut_minimized = mata_nfa.minimize(aut)
+                check_automaton(budget, aut_minimized)
             return aut_minimized, aut, variables
         else:
             raise UnexpectedInput("Formula does not have form t <= s. Can not display atomic construction.")
     else:
-        aut = mata_nfa.minimize(aut)
+        with stage(trace, "minimize"):
+            check(budget)
+            aut = mata_nfa.minimize(aut)
+            check_automaton(budget, aut)
+    if key is not None:
+        with stage(trace, "store_put"):
+            store.put(key, aut, variables)
     return aut, aut, variables
 
 
-def test_formula(formula: str, mode = "plain"):
-    clean_formula = macro_preprocessor.process_macros(formula)
-    tree = parser.parse_formula(clean_formula)
-    if mode == "plain":
-        pure_tree = expander.expand_shorthands(tree)
-    else:
-        pure_tree = expander.process_syntax_tree(tree)
-    aut, variables = build_automaton(pure_tree, mode)
-    if not is_deterministic(aut):
-        aut = determinize(aut)
-    aut = mata_nfa.minimize(aut)
+def test_formula(formula: str, mode = "plain", trace=None):
+    with stage(trace, "parse"):
+        tree = macro_preprocessor.process_macros(formula)
+    with stage(trace, "normalize"):
+        if mode == "plain":
+            pure_tree = expander.expand_shorthands(tree)
+        else:
+            pure_tree = expander.process_syntax_tree(tree)
+    with stage(trace, "construction"):
+        aut, variables = build_automaton(pure_tree, mode, trace)
+    with stage(trace, "minimize"):
+        if not is_deterministic(aut):
+            aut = determinize(aut)
+        aut = mata_nfa.minimize(aut)
     num_states = len(aut.get_reachable_states())
     dot = aut.to_dot_str()
     return dot, num_states
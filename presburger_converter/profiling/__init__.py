@@ -0,0 +1,6 @@
+from .trace import ConstructionTrace, stage
+
+__all__ = [
+    "ConstructionTrace",
+    "stage",
+]
\ No newline at end of file
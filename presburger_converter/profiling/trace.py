@@ -0,0 +1,145 @@
+# trace.py
+"""
+Opt-in instrumentation for the formula → automaton pipeline.
+
+A :class:`ConstructionTrace` is handed to ``formula_to_aut`` (and from there to
+``build_automaton``).  Every pipeline stage and every AST node visited during
+construction opens a nested *stage*; the result is a tree of timings plus
+per-node state/transition counts that can be exported as JSON or as folded
+stacks for flame-graph tools.
+"""
+from __future__ import annotations
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class ConstructionTrace:
+    """Collects nested stage timings and automaton sizes.
+
+    Parameters
+    ----------
+    track_memory : bool
+        Additionally record the peak Python heap usage of every stage via
+        :mod:`tracemalloc`.  This slows construction down noticeably, so it is
+        off by default.
+    """
+
+    def __init__(self, track_memory: bool = False):
+        self.track_memory = track_memory
+        self.root: Dict[str, Any] = {"name": "total", "elapsed_s": 0.0, "children": []}
+        self.nodes: List[Dict[str, Any]] = []
+        self.peak_states = 0
+        self.peak_transitions = 0
+        self._stack: List[Dict[str, Any]] = [self.root]
+        self._started_tracemalloc = False
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name: str, **info: Any) -> Iterator[Dict[str, Any]]:
+        """Time the enclosed block as a child of the currently open stage."""
+        record: Dict[str, Any] = {"name": name, **info, "elapsed_s": 0.0, "children": []}
+        parent = self._stack[-1]
+        parent["children"].append(record)
+        self._stack.append(record)
+
+        if self.track_memory:
+            self._enter_memory(parent)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["elapsed_s"] = time.perf_counter() - start
+            if self.track_memory:
+                self._exit_memory(record, parent)
+            self._stack.pop()
+            if parent is self.root:
+                self.root["elapsed_s"] += record["elapsed_s"]
+
+    def record_automaton(self, record: Dict[str, Any], aut, variables) -> None:
+        """Attach the size of *aut* to *record* and update the peak counters."""
+        num_states = aut.num_of_states()
+        num_transitions = len(aut.get_trans_as_sequence())
+        record["variables"] = list(variables)
+        record["num_states"] = num_states
+        record["num_transitions"] = num_transitions
+        self.peak_states = max(self.peak_states, num_states)
+        self.peak_transitions = max(self.peak_transitions, num_transitions)
+        self.nodes.append(
+            {
+                "node": record["name"],
+                "num_variables": len(variables),
+                "num_states": num_states,
+                "num_transitions": num_transitions,
+                "elapsed_s": record["elapsed_s"],
+            }
+        )
+
+    def _enter_memory(self, parent: Dict[str, Any]) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        # Fold the peak reached so far into the parent before resetting, so
+        # that nested stages do not hide the parent's own peak.
+        _, peak = tracemalloc.get_traced_memory()
+        parent["_peak"] = max(parent.get("_peak", 0), peak)
+        tracemalloc.reset_peak()
+
+    def _exit_memory(self, record: Dict[str, Any], parent: Dict[str, Any]) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, record.pop("_peak", 0))
+        record["peak_memory_bytes"] = peak
+        parent["_peak"] = max(parent.get("_peak", 0), peak)
+        if parent is self.root and self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the trace as plain, JSON-serialisable data."""
+        root = {k: v for k, v in self.root.items() if k != "_peak"}
+        return {
+            "stages": root,
+            "nodes": self.nodes,
+            "peak_states": self.peak_states,
+            "peak_transitions": self.peak_transitions,
+        }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_folded(self) -> str:
+        """Return the stage tree in *folded stacks* format.
+
+        One line per stage, ``root;child;grandchild <self time in µs>``, which
+        is the input format of ``flamegraph.pl``, speedscope and inferno.
+        """
+        lines: List[str] = []
+
+        def _walk(record: Dict[str, Any], prefix: str) -> None:
+            path = f"{prefix};{record['name']}" if prefix else record["name"]
+            children_time = sum(c["elapsed_s"] for c in record["children"])
+            self_us = int(round((record["elapsed_s"] - children_time) * 1e6))
+            if self_us > 0:
+                lines.append(f"{path} {self_us}")
+            for child in record["children"]:
+                _walk(child, path)
+
+        _walk(self.root, "")
+        return "\n".join(lines)
+
+
+def stage(trace: Optional[ConstructionTrace], name: str, **info: Any):
+    """``trace.stage(name)`` if tracing is enabled, a no-op context otherwise."""
+    if trace is None:
+        return nullcontext()
+    return trace.stage(name, **info)
@@ -0,0 +1,126 @@
+# sessions.py
+"""
+Bounded in-process store of compiled automata for the web backend.
+
+``/automaton/dot`` compiles a formula once and registers the result under an
+opaque *handle*.  Follow-up requests (more solutions, a different variable
+order) pass the handle instead of the automaton and only pay for the
+incremental work: the solution enumeration resumes from its cursor and DOT
+renderings are cached per ``(variable order, display_labels, max_states)``.
+The backend runs both in threads; a session's lock keeps concurrent requests
+for the same handle from interleaving on its cursor and cache.
+A formula edited from a session's formula is compiled with the session's
+``subformulas`` cache, which the new session then takes over.
+
+Sessions are evicted least-recently-used once ``max_sessions`` is exceeded
+and expire ``ttl`` seconds after their last use, so a client must be ready
+to fall back to re-sending the automaton when its handle is gone.
+"""
+from __future__ import annotations
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from presburger_converter.solutions.finder import SolutionCursor, find_example_solutions
+
+
+@dataclass
+class AutomatonSession:
+    """Everything kept for one compiled formula."""
+    aut_min: Any                          # used for solutions
+    aut: Any                              # the automaton that is displayed
+    variables: List[str]
+    display_atomic_construction: bool = False
+    formula: Optional[str] = None
+    integers: bool = False                # variables range over ℤ
+    subformulas: Optional[Any] = None     # SubformulaCache of the formula's edits
+    cursor: SolutionCursor = field(init=False)
+    dot_cache: Dict[Tuple[Any, ...], str] = field(default_factory=dict)
+    last_used: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.cursor = SolutionCursor(self.aut_min, self.integers)
+
+    def solutions(self, k_solutions: int,
+                  new_order: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """The first *k_solutions* example solutions, resuming the cursor."""
+        with self.lock:
+            return find_example_solutions(
+                self.aut_min, k_solutions, self.variables, new_order,
+                cursor=self.cursor, integers=self.integers,
+            )
+
+    def dot(self, new_order: Optional[List[str]], display_labels: bool, render,
+            max_states: Optional[int] = None) -> str:
+        """Return ``render(...)``'s DOT for this view, computing it only once."""
+        key = (tuple(new_order) if new_order else None, display_labels, max_states)
+        with self.lock:
+            if key not in self.dot_cache:
+                self.dot_cache[key] = render(
+                    self.aut, self.variables, new_order, display_labels,
+                    self.display_atomic_construction, max_states,
+                )
+            return self.dot_cache[key]
+
+
+class SessionStore:
+    """Thread-safe LRU + TTL map from handles to :class:`AutomatonSession`.
+
+    Parameters
+    ----------
+    max_sessions : int
+        Number of sessions kept at most; the least recently used is dropped.
+    ttl : float
+        Seconds after its last use at which a session expires.
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, AutomatonSession] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, aut_min, aut, variables: List[str], **kwargs: Any) -> Tuple[str, AutomatonSession]:
+        """Register a new session and return ``(handle, session)``."""
+        session = AutomatonSession(aut_min, aut, list(variables), **kwargs)
+        handle = secrets.token_urlsafe(16)
+        with self._lock:
+            self._sessions[handle] = session
+            self._expire(time.monotonic())
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return handle, session
+
+    def get(self, handle: Optional[str]) -> Optional[AutomatonSession]:
+        """Return the live session of *handle* or ``None`` if unknown/expired."""
+        if not handle:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(handle)
+            if session is None:
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(handle)
+            return session
+
+    def drop(self, handle: str) -> None:
+        with self._lock:
+            self._sessions.pop(handle, None)
+
+    def _expire(self, now: float) -> None:
+        # The dict is in LRU order, so expired sessions are all at the front.
+        while self._sessions:
+            handle, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl:
+                break
+            del self._sessions[handle]
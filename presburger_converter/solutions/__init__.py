@@ -1,5 +1,11 @@
-from .finder import find_example_solutions
+from presburger_converter._lazy import attach
 
-__all__ = [
-    "find_example_solutions",
-]
\ No newline at end of file
+__getattr__, __dir__, __all__ = attach(__name__, {
+    "find_example_solutions": ".finder",
+    "SolutionCursor": ".finder",
+    "to_msbf": ".ordered",
+    "iter_values": ".ordered",
+    "value_bounds": ".ordered",
+    "smallest_solution": ".ordered",
+    "optimize": ".ordered",
+})
\ No newline at end of file
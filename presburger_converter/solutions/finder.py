@@ -3,21 +3,14 @@ from collections import deque
 import libmata.nfa.nfa as mata_nfa
 from typing import List, Dict, Any, Optional, Tuple, Set
 
-
-def _int_to_lsbf(num: int, width: int) -> List[int]:
-    """Return `width` bits, least-significant-bit first."""
-    return [(num >> i) & 1 for i in range(width)]
-
-
-def _lsbf_bits_to_int(bits: str) -> int:
-    """Reverse of _int_to_lsbf for a bit-string such as '0101' (LSBF)."""
-    return sum((int(b) << i) for i, b in enumerate(bits))
+from presburger_converter.automaton.labels import BitPermutation, symbol_to_bits
 
 
 def describe_paths(
     variables: List[str],
     paths: List[List[int]],
     new_order: Optional[List[str]] = None,
+    integers: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Convert integer-label paths into rich, human-readable descriptions.
@@ -32,6 +25,9 @@ def describe_paths(
         If given, must contain *exactly* the same variable names but in a
         different order.  Bits inside every path label are re-ordered
         accordingly **before** all other computations.
+    integers : bool
+        Read the bits as two's complement (the last label holds the sign
+        bits) instead of as naturals.
 
     Returns
     -------
@@ -45,33 +41,25 @@ def describe_paths(
             * "var_ints"   – {var: integer value}
     """
     n = len(variables)
-    if new_order is None:
-        mapping = list(range(n))                  # identity
-        var_out = variables
-    else:
-        if sorted(new_order) != sorted(variables):
-            raise ValueError("new_order must contain the same variables.")
-        mapping = [variables.index(v) for v in new_order]
-        var_out = new_order
+    perm = BitPermutation.between(variables, new_order)
+    var_out = variables if new_order is None else new_order
 
     solutions = []
 
     for path in paths:
         # 1. Re-order every label *inside the path* if needed
-        path_bits = []
-        for label in path:
-            bits = _int_to_lsbf(label, n)         # old order
-            reordered = [bits[i] for i in mapping]
-            path_bits.append("".join(str(b) for b in reordered))
-
-        # 2. Build bit-strings for each variable (in var_out order)
-        var_bits = [""] * n
-        for step_bits in path_bits:
-            for idx, bit_char in enumerate(step_bits):
-                var_bits[idx] += bit_char
-
-        # 3. Convert those bit-strings to integers
-        var_ints = [_lsbf_bits_to_int(bstr) if bstr else 0 for bstr in var_bits]
+        labels = perm.apply(path)
+        path_bits = [symbol_to_bits(label, n) for label in labels]
+
+        # 2. Collect the bits of each variable (in var_out order), LSB first
+        var_ints = [0] * n
+        for step, label in enumerate(labels):
+            for idx in range(n):
+                var_ints[idx] |= (label >> idx & 1) << step
+        if integers and labels:
+            sign = len(labels) - 1
+            var_ints = [v - (2 << sign) if v >> sign & 1 else v for v in var_ints]
+        var_bits = ["".join(bits[idx] for bits in path_bits) for idx in range(n)]
 
         solutions.append(
             {
@@ -95,6 +83,71 @@ def remove_trailing_zeros(seq: List[int]) -> List[int]:
         i -= 1
     return seq[:i]
 
+def remove_sign_extension(seq: List[int]) -> List[int]:
+    """
+    Removes repetitions of the last element (the sign label of a two's
+    complement word) from the end of a list.
+    """
+    i = len(seq)
+    while i > 1 and seq[i - 2] == seq[-1]:
+        i -= 1
+    return seq[:i]
+
+class SolutionCursor:
+    """
+    Resumable breadth-first enumeration of the accepting paths of an NFA.
+
+    The paths found so far and the BFS frontier are kept, so asking for
+    more solutions later only continues the search instead of starting it
+    over.  ``find_shortest_paths(nfa, k)`` equals ``SolutionCursor(nfa).take(k)``.
+
+    With *integers* the automaton is read in two's complement, where
+    repeating the last (sign) label does not change the solution.
+    """
+
+    def __init__(self, nfa: mata_nfa.Nfa, integers: bool = False):
+        self.nfa = nfa
+        self.integers = integers
+        self.solutions: List[List[int]] = []
+        # (state, path_so_far)
+        self._queue: deque[Tuple[int, List[int]]] = deque(
+            (init, []) for init in nfa.initial_states
+        )
+        self._seen: Set[Tuple[int, ...]] = set()   # dedup identical label sequences
+
+    @property
+    def exhausted(self) -> bool:
+        """True once every accepting path has been found."""
+        return not self._queue
+
+    def take(self, k: int) -> List[List[int]]:
+        """Return the first *k* paths (fewer if the automaton has fewer)."""
+        nfa = self.nfa
+        queue = self._queue
+        solutions = self.solutions
+        while queue and len(solutions) < k:
+            state, path = queue.popleft()
+
+            # Accepting configuration?
+            if state in nfa.final_states:
+                if self.integers:
+                    t_path = tuple(remove_sign_extension(path))
+                else:
+                    t_path = tuple(remove_trailing_zeros(path))
+                if t_path not in self._seen:
+                    self._seen.add(t_path)
+                    solutions.append(path)
+
+            # Breadth-first expansion
+            transitions = nfa.get_trans_from_state_as_sequence(state)
+            if not (len(transitions) == 1 and transitions[0].target == state
+                    and (self.integers or transitions[0].symbol == 0)):
+                for tr in transitions:
+                    queue.append((tr.target, path + [tr.symbol]))
+
+        return solutions[:max(k, 0)]
+
+
 def find_shortest_paths(nfa: mata_nfa.Nfa, k: int = 1) -> List[List[int]]:
     """
     Return up to *k* shortest accepting paths of an NFA, even in the presence
@@ -115,43 +168,25 @@ def find_shortest_paths(nfa: mata_nfa.Nfa, k: int = 1) -> List[List[int]]:
     """
     if k <= 0:
         return []
+    return SolutionCursor(nfa).take(k)
 
-    # (state, path_so_far)
-    queue: deque[Tuple[int, List[int]]] = deque(
-        (init, []) for init in nfa.initial_states
-    )
-
-    solutions: List[List[int]] = []
-    seen_solutions: Set[Tuple[int, ...]] = set()   # dedup identical label sequences
 
-    while queue and len(solutions) < k:
-        state, path = queue.popleft()
+def find_example_solutions(aut, k_solutions, variables_order, new_variable_order = None, cursor = None,
+                           integers = False):
+    """Describe the *k_solutions* shortest solutions of *aut*.
 
-        # Accepting configuration?
-        if state in nfa.final_states:
-            t_path = tuple(remove_trailing_zeros(path))
-            if t_path not in seen_solutions:
-                seen_solutions.add(t_path)
-                solutions.append(path)
-                if len(solutions) == k:          # got enough → stop early
-                    break
-
-        # Breadth-first expansion
-        transitions = nfa.get_trans_from_state_as_sequence(state)
-        if not (len(transitions) == 1 and transitions[0].symbol == 0 and transitions[0].target == state):
-            for tr in transitions:
-                queue.append((tr.target, path + [tr.symbol]))
-
-    return solutions
-
-
-def find_example_solutions(aut, k_solutions, variables_order, new_variable_order = None):
-    example_solutions = find_shortest_paths(aut, k_solutions)
+    Passing the :class:`SolutionCursor` of *aut* as *cursor* reuses the
+    paths it already found and continues its search if more are needed.
+    *integers* must match the mode *aut* was built in.
+    """
+    if cursor is None:
+        cursor = SolutionCursor(aut, integers)
+    example_solutions = cursor.take(k_solutions) if k_solutions > 0 else []
     if new_variable_order:
-        example_solutions = describe_paths(variables_order, example_solutions, new_variable_order)
+        example_solutions = describe_paths(variables_order, example_solutions, new_variable_order, integers)
     else:
         # comment out for benchmarks
-        example_solutions = describe_paths(variables_order, example_solutions)
+        example_solutions = describe_paths(variables_order, example_solutions, integers=integers)
     if all(not d["var_ints"] for d in example_solutions):
         return []
     return example_solutions
@@ -0,0 +1,356 @@
+# ordered.py
+"""
+Value-ordered queries on the solution set of an automaton.
+
+The automata built here read numbers least significant bit first, so
+:func:`~presburger_converter.solutions.finder.find_shortest_paths` yields
+solutions by bit length, and a bound can only be found by scanning many of
+them.  Read most significant bit first (MSBF), shortlex order on the bits of
+one variable is numeric order once leading zeros are skipped.  The queries
+below therefore
+
+* reverse the automaton into a minimal MSBF DFA (:func:`to_msbf`),
+* project that to the bits of the queried variable, with every state reached
+  by leading zeros made initial, and minimize it to a small binary DFA, and
+* answer on that DFA in one pass: a breadth-first search for the smallest
+  value or an ascending enumeration, a longest-path search for the largest.
+
+In two's complement the first bit is the sign and may repeat, so there is a
+track for the non-negative and one for the negative words; among negative
+words the longer ones are the smaller values.
+
+Fixing a variable to a value is a product with the automaton of its bits, so
+the lexicographically smallest assignment takes one such pass per variable
+and :func:`optimize` finds a witness of the optimum with one more search.
+:func:`iter_values` and :func:`smallest_solution` need natural-number
+automata.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import libmata.nfa.nfa as mata_nfa
+
+from presburger_converter.solutions.finder import describe_paths
+
+
+def to_msbf(aut: mata_nfa.Nfa) -> mata_nfa.Nfa:
+    """Minimal DFA of the reversed language of *aut*: the same solutions, MSBF."""
+    return mata_nfa.minimize(mata_nfa.revert(aut))
+
+
+def _bit(variables: Sequence[str], var: str) -> int:
+    if var not in variables:
+        raise ValueError(f"{var} is not a variable of the automaton.")
+    return list(variables).index(var)
+
+
+class _Track:
+    """Minimal binary DFA of the bits of one variable of an MSBF automaton.
+
+    Its start state already stands for any number of leading zeros, so no
+    canonical word starts with ``0``.  With *sign* the automaton is read in
+    two's complement and the track only covers the words whose sign bit is
+    *sign*; the start state then stands for the sign bit and its
+    repetitions.  ``start`` is ``None`` if there is no such word.
+    """
+
+    def __init__(self, msbf: mata_nfa.Nfa, bit: int, sign: Optional[int] = None):
+        succ: Dict[int, set] = {}
+        for t in msbf.get_trans_as_sequence():
+            succ.setdefault(t.source, set()).add((t.symbol >> bit & 1, t.target))
+
+        nfa = mata_nfa.Nfa(msbf.num_of_states())
+        for src, edges in succ.items():
+            for b, dst in edges:
+                nfa.add_transition(src, b, dst)
+        if sign is None:
+            pad, leading = 0, set(msbf.initial_states)
+        else:
+            pad = sign
+            leading = {dst for q in msbf.initial_states
+                       for b, dst in succ.get(q, ()) if b == sign}
+        queue = deque(leading)
+        while queue:
+            for b, dst in succ.get(queue.popleft(), ()):
+                if b == pad and dst not in leading:
+                    leading.add(dst)
+                    queue.append(dst)
+        nfa.make_initial_states(list(leading))
+        nfa.make_final_states(list(msbf.final_states))
+
+        dfa = mata_nfa.minimize(nfa).trim()
+        self.delta: Dict[int, Dict[int, int]] = {}
+        for t in dfa.get_trans_as_sequence():
+            self.delta.setdefault(t.source, {})[t.symbol] = t.target
+        self.final = set(dfa.final_states)
+        initial = list(dfa.initial_states)
+        self.start: Optional[int] = initial[0] if initial else None
+
+    def step(self, state: int, b: int) -> Optional[int]:
+        return self.delta.get(state, {}).get(b)
+
+    def shortest(self, state: int, order: Tuple[int, int]) -> str:
+        """The shortest word accepted from *state*, bits tried in *order*.
+
+        With ``order=(0, 1)`` this is the shortlex-smallest word, with
+        ``(1, 0)`` the largest of the shortest ones.
+        """
+        seen = {state}
+        queue = deque([(state, "")])
+        while queue:
+            state, word = queue.popleft()
+            if state in self.final:
+                return word
+            for b in order:
+                nxt = self.step(state, b)
+                if nxt is not None and nxt not in seen:
+                    seen.add(nxt)
+                    queue.append((nxt, word + str(b)))
+        raise AssertionError("the track DFA is trimmed")
+
+    def longest(self, state: int, order: Tuple[int, int]) -> Optional[str]:
+        """The longest word accepted from *state*, ``None`` if they are unbounded.
+
+        Every state of the trimmed DFA reaches a final state, so the words
+        are unbounded exactly if a cycle is reachable.  Otherwise a DP in
+        post-order over the reachable DAG picks the longest word, among those
+        the one taking the bits in *order*.
+        """
+        length: Dict[int, int] = {}
+        choice: Dict[int, Optional[int]] = {}
+        on_path = {state}
+        work = [(state, iter(self._edges(state, order)))]
+        while work:
+            q, edges = work[-1]
+            for b, nxt in edges:
+                if nxt in on_path:
+                    return None
+                if nxt not in length:
+                    on_path.add(nxt)
+                    work.append((nxt, iter(self._edges(nxt, order))))
+                    break
+            else:
+                work.pop()
+                on_path.discard(q)
+                best, pick = (0, None) if q in self.final else (-1, None)
+                for b, nxt in self._edges(q, order):
+                    if length[nxt] + 1 > best:
+                        best, pick = length[nxt] + 1, b
+                length[q], choice[q] = best, pick
+
+        bits = []
+        while choice[state] is not None:
+            bits.append(str(choice[state]))
+            state = self.delta[state][choice[state]]
+        return "".join(bits)
+
+    def _edges(self, state: int, order: Tuple[int, int]) -> List[Tuple[int, int]]:
+        out = self.delta.get(state, {})
+        return [(b, out[b]) for b in order if b in out]
+
+
+def _natural_extreme(track: _Track, maximize: bool) -> Optional[str]:
+    """Bits of the smallest/largest value of *track* (``""`` for 0).
+
+    ``None`` if the values are unbounded.  The track must not be empty.
+    """
+    if not maximize:
+        return track.shortest(track.start, (0, 1))
+    first = track.step(track.start, 1)
+    if first is None:
+        return ""
+    rest = track.longest(first, (1, 0))
+    return None if rest is None else "1" + rest
+
+
+def _extreme(msbf: mata_nfa.Nfa, bit: int, maximize: bool, integers: bool
+             ) -> Tuple[str, Optional[str]]:
+    """``(status, bits)`` of the optimum of track *bit* of *msbf*.
+
+    *status* is ``"optimal"``, ``"unbounded"`` or ``"infeasible"``; *bits*
+    are the shortest representation of the optimal value: without leading
+    zeros for naturals, the minimal two's complement word for integers.
+    """
+    if not integers:
+        track = _Track(msbf, bit)
+        if track.start is None:
+            return "infeasible", None
+        bits = _natural_extreme(track, maximize)
+        return ("unbounded", None) if bits is None else ("optimal", bits)
+
+    positive, negative = _Track(msbf, bit, sign=0), _Track(msbf, bit, sign=1)
+    if positive.start is None and negative.start is None:
+        return "infeasible", None
+    if negative.start is None or maximize and positive.start is not None:
+        bits = _natural_extreme(positive, maximize)
+        return ("unbounded", None) if bits is None else ("optimal", "0" + bits)
+
+    # The canonical negative words are "1" (-1) and "10w" (-2^(|w|+1) + w);
+    # the longer w, the smaller the value.
+    first = negative.step(negative.start, 0)
+    if first is None or maximize and negative.start in negative.final:
+        return "optimal", "1"
+    if maximize:
+        return "optimal", "10" + negative.shortest(first, (1, 0))
+    rest = negative.longest(first, (0, 1))
+    return ("unbounded", None) if rest is None else ("optimal", "10" + rest)
+
+
+def _to_int(bits: str, integers: bool) -> int:
+    value = int(bits or "0", 2)
+    if integers and bits[0] == "1":
+        value -= 1 << len(bits)
+    return value
+
+
+def _fix(msbf: mata_nfa.Nfa, bit: int, bits: str, integers: bool = False) -> mata_nfa.Nfa:
+    """*msbf* restricted to the words whose track *bit* reads the number *bits*.
+
+    *bits* is the shortest representation as returned by :func:`_extreme`;
+    leading zeros (for integers: repetitions of the sign bit) are allowed.
+    """
+    pad_at, pad = (1, int(bits[0])) if integers else (0, 0)
+    final = set(msbf.final_states)
+    out = mata_nfa.Nfa()
+    ids: Dict[Tuple[int, int], int] = {}
+    queue = deque()
+
+    def state(q: int, k: int) -> int:
+        if (q, k) not in ids:
+            ids[q, k] = out.add_new_state()
+            if k == len(bits) and q in final:
+                out.make_final_state(ids[q, k])
+            queue.append((q, k))
+        return ids[q, k]
+
+    for q in msbf.initial_states:
+        out.make_initial_state(state(q, 0))
+    while queue:
+        q, k = queue.popleft()
+        src = ids[q, k]
+        for t in msbf.get_trans_from_state_as_sequence(q):
+            b = t.symbol >> bit & 1
+            if k == pad_at and b == pad:                 # leading zero or sign
+                nxt = k
+            elif k < len(bits) and b == int(bits[k]):
+                nxt = k + 1
+            else:
+                continue
+            out.add_transition(src, t.symbol, state(t.target, nxt))
+    return mata_nfa.minimize(out)
+
+
+def _shortest_word(msbf: mata_nfa.Nfa) -> Optional[List[int]]:
+    """The shortest accepted word, smallest letters first."""
+    final = set(msbf.final_states)
+    parent: Dict[int, Optional[Tuple[int, int]]] = {q: None for q in msbf.initial_states}
+    queue = deque(sorted(parent))
+    while queue:
+        q = queue.popleft()
+        if q in final:
+            word = []
+            while parent[q] is not None:
+                q, symbol = parent[q]
+                word.append(symbol)
+            return word[::-1]
+        for t in sorted(msbf.get_trans_from_state_as_sequence(q), key=lambda t: t.symbol):
+            if t.target not in parent:
+                parent[t.target] = (q, t.symbol)
+                queue.append(t.target)
+    return None
+
+
+def iter_values(aut: mata_nfa.Nfa, variables: Sequence[str], var: str) -> Iterator[int]:
+    """Every value *var* takes in a solution of *aut*, in ascending order.
+
+    The enumeration is lazy and infinite for unbounded variables.
+    """
+    track = _Track(to_msbf(aut), _bit(variables, var))
+    if track.start is None:
+        return
+    if track.start in track.final:
+        yield 0
+    first = track.delta.get(track.start, {}).get(1)
+    level = [] if first is None else [(first, 1)]
+    while level:
+        for state, value in level:
+            if state in track.final:
+                yield value
+        level = [
+            (nxt, value << 1 | b)
+            for state, value in level
+            for b, nxt in sorted(track.delta.get(state, {}).items())
+        ]
+
+
+def value_bounds(aut: mata_nfa.Nfa, variables: Sequence[str], var: str,
+                 integers: bool = False) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """``(min, max)`` of *var* over the solutions of *aut*.
+
+    A bound is ``None`` if *var* is unbounded in that direction; the result
+    is ``None`` if *aut* has no solution at all.
+    """
+    msbf = to_msbf(aut)
+    bit = _bit(variables, var)
+    bounds = []
+    for maximize in (False, True):
+        status, bits = _extreme(msbf, bit, maximize, integers)
+        if status == "infeasible":
+            return None
+        bounds.append(None if bits is None else _to_int(bits, integers))
+    return bounds[0], bounds[1]
+
+
+def smallest_solution(aut: mata_nfa.Nfa, variables: List[str],
+                      order: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+    """The lexicographically smallest solution of *aut*.
+
+    The variables of *order* (default: *variables*) are minimized one after
+    the other, each with the previous ones fixed; variables not in *order*
+    take the values of the shortest remaining solution.  The result is
+    described like the entries of ``find_example_solutions``, or ``None``
+    if there is no solution.
+    """
+    msbf = to_msbf(aut)
+    for var in (variables if order is None else order):
+        bit = _bit(variables, var)
+        status, bits = _extreme(msbf, bit, False, False)
+        if status == "infeasible":
+            return None
+        msbf = _fix(msbf, bit, bits)
+    word = _shortest_word(msbf)
+    if word is None:
+        return None
+    return describe_paths(variables, [word[::-1]])[0]
+
+
+def optimize(aut: mata_nfa.Nfa, variables: List[str], objective_var: str,
+             direction: str = "min", integers: bool = False) -> Dict[str, Any]:
+    """Minimize or maximize *objective_var* over the solutions of *aut*.
+
+    *direction* is ``"min"`` or ``"max"``.  Returns a dictionary with
+
+    * ``"status"`` – ``"optimal"``, ``"unbounded"`` or ``"infeasible"``,
+    * ``"value"`` – the optimum (``None`` unless optimal), and
+    * ``"solution"`` – a solution attaining it, described like the entries
+      of ``find_example_solutions`` (``None`` unless optimal).
+
+    The optimum is found in one search over the minimized DFA of the
+    variable's bits, the witness by one more over the automaton with the
+    variable fixed to it.
+    """
+    if direction not in ("min", "max"):
+        raise ValueError("direction must be 'min' or 'max'.")
+    msbf = to_msbf(aut)
+    bit = _bit(variables, objective_var)
+    status, bits = _extreme(msbf, bit, direction == "max", integers)
+    if status != "optimal":
+        return {"status": status, "value": None, "solution": None}
+    word = _shortest_word(_fix(msbf, bit, bits, integers))
+    return {
+        "status": status,
+        "value": _to_int(bits, integers),
+        "solution": describe_paths(variables, [word[::-1]], integers=integers)[0],
+    }
@@ -1,5 +1,6 @@
-from .dot import aut_to_dot
+from presburger_converter._lazy import attach
 
-__all__ = [
-    "aut_to_dot"
-]
\ No newline at end of file
+__getattr__, __dir__, __all__ = attach(__name__, {
+    "aut_to_dot": ".dot",
+    "summary_dot": ".summary",
+})
\ No newline at end of file
@@ -0,0 +1,174 @@
+# summary.py
+"""
+Aggregated DOT view of automata too large to be drawn state by state.
+
+The view is computed from the transition structure directly, never from the
+full DOT string:
+
+* states from which no final state is reachable are collapsed into a single
+  *sink* node,
+* the remaining states are condensed into their strongly connected
+  components, and
+* only the ``top_n`` components closest to the initial states (by BFS depth
+  in the condensation) are drawn; all others become one *more* node.
+
+Edges between the drawn nodes are labelled with the number of transitions
+they stand for.
+"""
+from __future__ import annotations
+
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Set
+
+from presburger_converter.automaton.automaton_builder import decode
+
+
+def _successors(aut, reachable: Set[int]) -> Dict[int, Counter]:
+    """``succ[src][dst]`` = number of symbols on the transitions src -> dst."""
+    succ: Dict[int, Counter] = defaultdict(Counter)
+    for t in aut.get_trans_as_sequence():
+        if t.source in reachable:
+            succ[t.source][t.target] += 1
+    return succ
+
+
+def _live_states(succ: Dict[int, Counter], reachable: Set[int], final: Set[int]) -> Set[int]:
+    """Reachable states from which a final state can be reached."""
+    pred: Dict[int, List[int]] = defaultdict(list)
+    for src, targets in succ.items():
+        for dst in targets:
+            pred[dst].append(src)
+    live = final & reachable
+    queue = deque(live)
+    while queue:
+        for src in pred[queue.popleft()]:
+            if src not in live:
+                live.add(src)
+                queue.append(src)
+    return live
+
+
+def _components(succ: Dict[int, Counter], states: Set[int]) -> Dict[int, int]:
+    """Map every state of *states* to the index of its SCC (iterative Tarjan)."""
+    index: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    on_stack: Set[int] = set()
+    stack: List[int] = []
+    component: Dict[int, int] = {}
+    count = 0
+
+    for root in sorted(states):
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter([d for d in succ.get(root, ()) if d in states]))]
+        while work:
+            state, it = work[-1]
+            for dst in it:
+                if dst not in index:
+                    index[dst] = low[dst] = len(index)
+                    stack.append(dst)
+                    on_stack.add(dst)
+                    work.append((dst, iter([d for d in succ.get(dst, ()) if d in states])))
+                    break
+                if dst in on_stack:
+                    low[state] = min(low[state], index[dst])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[state])
+                if low[state] == index[state]:
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component[member] = count
+                        if member == state:
+                            break
+                    count += 1
+    return component
+
+
+def summary_dot(aut, top_n: int = 50, display_atomic_construction: bool = False) -> str:
+    """Return the aggregated DOT view of *aut* (see the module docstring)."""
+    reachable = set(aut.get_reachable_states())
+    final = set(aut.final_states)
+    initial = [s for s in aut.initial_states if s in reachable]
+    succ = _successors(aut, reachable)
+    live = _live_states(succ, reachable, final)
+    component = _components(succ, live)
+
+    members: Dict[int, List[int]] = defaultdict(list)
+    for state, comp in component.items():
+        members[comp].append(state)
+
+    # BFS over the condensation from the initial components.
+    comp_succ: Dict[int, Set[int]] = defaultdict(set)
+    for src, targets in succ.items():
+        if src in live:
+            for dst in targets:
+                if dst in live and component[dst] != component[src]:
+                    comp_succ[component[src]].add(component[dst])
+    depth: Dict[int, int] = {}
+    queue = deque()
+    for state in initial:
+        if state in live and component[state] not in depth:
+            depth[component[state]] = 0
+            queue.append(component[state])
+    while queue:
+        comp = queue.popleft()
+        for nxt in sorted(comp_succ[comp]):
+            if nxt not in depth:
+                depth[nxt] = depth[comp] + 1
+                queue.append(nxt)
+    shown = set(sorted(depth, key=lambda c: (depth[c], min(members[c])))[:top_n])
+
+    def node_of(state: int) -> str:
+        if state not in live:
+            return "sink"
+        comp = component[state]
+        return f"c{comp}" if comp in shown else "more"
+
+    edges: Counter = Counter()
+    for src, targets in succ.items():
+        for dst, n in targets.items():
+            edges[node_of(src), node_of(dst)] += n
+
+    def name(state: int) -> int:
+        return decode(state) if display_atomic_construction else state
+
+    num_transitions = sum(sum(t.values()) for t in succ.values())
+    lines = [
+        "digraph G {",
+        "layout=dot;",
+        "rankdir=LR;",
+        'size="16,9";',
+        f'label="summary of {len(reachable)} states and {num_transitions} transitions; '
+        f'{len(members)} strongly connected components";',
+        "labelloc=t;",
+    ]
+    for comp in sorted(shown, key=lambda c: (depth[c], min(members[c]))):
+        states = members[comp]
+        n_final = sum(1 for s in states if s in final)
+        if len(states) == 1:
+            shape = "doublecircle" if n_final else "circle"
+            lines.append(f'c{comp} [shape={shape}, label="{name(states[0])}"];')
+        else:
+            peripheries = 2 if n_final else 1
+            lines.append(f'c{comp} [shape=box, peripheries={peripheries}, '
+                         f'label="{len(states)} states\\n{n_final} final"];')
+    hidden = len(live) - sum(len(members[c]) for c in shown)
+    if hidden:
+        lines.append(f'more [shape=box, style=dashed, label="{hidden} more states"];')
+    if len(reachable) > len(live):
+        lines.append(f'sink [shape=box, style=filled, fillcolor=lightgray, '
+                     f'label="{len(reachable) - len(live)} rejecting sink states"];')
+    for (src, dst), n in sorted(edges.items()):
+        lines.append(f'{src} -> {dst} [label="{n}"];')
+    lines.append("i0 [shape=point, width=0.01, height=0.01, style=invis];")
+    for target in dict.fromkeys(node_of(s) for s in initial):
+        lines.append(f"i0 -> {target} [arrowhead=normal, style=solid, weight=0];")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,350 @@
+# workers.py
+"""
+Process pool for running formula compilation off the web server's event loop.
+
+Unlike :class:`concurrent.futures.ProcessPoolExecutor`, a running job can be
+abandoned: on a timeout or when the client goes away its worker process is
+killed and replaced.  The number of requests waiting for a free worker is
+bounded, so an overloaded server rejects work early (:class:`PoolBusy`)
+instead of queueing it until every client has given up.
+
+Automata cross the process boundary in the compact binary format of
+:mod:`presburger_converter.automaton.mata_io`.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+import pickle
+import signal
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class PoolBusy(RuntimeError):
+    """Raised when the queue of waiting jobs is full."""
+
+
+class JobTimeout(RuntimeError):
+    """Raised when a job exceeds its time limit; its worker was restarted."""
+
+
+class JobCancelled(RuntimeError):
+    """Raised when a job was abandoned because its client disconnected."""
+
+
+class WorkerCrashed(RuntimeError):
+    """Raised when a worker process died while running a job."""
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _worker_main(conn) -> None:
+    # Ctrl-C on the server is handled by the parent, which stops the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            fn, args, kwargs = conn.recv()
+        except EOFError:
+            return
+        try:
+            reply = ("ok", fn(*args, **kwargs))
+        except Exception as exc:
+            reply = ("error", exc)
+        try:
+            conn.send(reply)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Not every exception survives pickling (e.g. ones holding a
+            # parser state); send its message instead.
+            conn.send(("error", RuntimeError(str(reply[1]))))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self.start()
+
+    def start(self) -> None:
+        self.conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+    def stop(self) -> None:
+        try:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+        except (RuntimeError, OSError, ValueError):
+            pass
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def result(self) -> "asyncio.Future[Any]":
+        """Return a future that resolves with the next reply from the worker."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        fd = self.conn.fileno()
+
+        def _readable() -> None:
+            loop.remove_reader(fd)
+            if future.done():
+                return
+            try:
+                future.set_result(self.conn.recv())
+            except (EOFError, OSError) as exc:
+                future.set_exception(WorkerCrashed(f"worker process died: {exc!r}"))
+
+        loop.add_reader(fd, _readable)
+        return future
+
+
+# ---------------------------------------------------------------------------
+# Pool
+# ---------------------------------------------------------------------------
+
+class WorkerPool:
+    """A fixed set of worker processes fed from the event loop.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes (default: number of CPUs).
+    max_queue : int
+        Number of jobs allowed to wait for a free worker; further
+        submissions raise :class:`PoolBusy`.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 16):
+        self.size = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._ctx = mp.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._waiting = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs currently waiting for a worker."""
+        return self._waiting
+
+    def _ensure_started(self) -> None:
+        # Started lazily so that the pool binds to the loop that serves it.
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            worker = _Worker(self._ctx)
+            self._workers.append(worker)
+            self._idle.put_nowait(worker)
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Run ``fn(*args, **kwargs)`` in a worker and return its result.
+
+        *fn* must be importable by the workers.  *timeout* bounds the time
+        spent running (not waiting); *is_disconnected* is polled while the
+        job runs and abandons it once it returns true.  Exceptions raised
+        by *fn* are re-raised here.
+        """
+        self._ensure_started()
+        if self._idle.empty() and self._waiting >= self.max_queue:
+            raise PoolBusy(f"{self._waiting} jobs are already waiting")
+
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        watcher = None
+        try:
+            worker.conn.send((fn, args, kwargs))
+            result = worker.result()
+            waiting_for = {result}
+            if is_disconnected is not None:
+                watcher = asyncio.ensure_future(_wait_disconnect(is_disconnected))
+                waiting_for.add(watcher)
+            done, _ = await asyncio.wait(
+                waiting_for, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if result not in done:
+                result.cancel()
+                worker.restart()
+                if watcher is not None and watcher in done:
+                    raise JobCancelled("client disconnected")
+                raise JobTimeout(f"job exceeded {timeout} s")
+            try:
+                status, value = result.result()
+            except WorkerCrashed:
+                worker.restart()
+                raise
+        except asyncio.CancelledError:
+            # The request handler itself was cancelled mid-job.
+            worker.restart()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self._idle.put_nowait(worker)
+
+        if status == "error":
+            raise value
+        return value
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.stop()
+        self._workers.clear()
+        self._idle = None
+
+
+async def _wait_disconnect(is_disconnected: Callable[[], Awaitable[bool]],
+                           interval: float = 0.25) -> None:
+    while not await is_disconnected():
+        await asyncio.sleep(interval)
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+def _subformula_cache(subformulas: Optional[Dict[str, Any]]):
+    """An unbounded ``SubformulaCache`` holding *subformulas* (``None`` stays ``None``)."""
+    if subformulas is None:
+        return None
+    from presburger_converter.incremental import SubformulaCache
+
+    cache = SubformulaCache(max_bytes=None)
+    cache.update(subformulas)
+    return cache
+
+
+def compile_job(
+    formula: str,
+    display_atomic_construction: bool = False,
+    display_labels: bool = True,
+    k_solutions: int = 9,
+    profile: bool = False,
+    store_dir: Optional[str] = None,
+    store_max_bytes: int = 256 * 2**20,
+    limits: Optional[Dict[str, Any]] = None,
+    dot_max_states: Optional[int] = None,
+    integers: bool = False,
+    subformulas: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Compile *formula* and prepare everything ``/automaton/dot`` returns.
+
+    Runs inside a worker; the automata are returned in the binary format
+    (``aut_min`` is ``None`` when it is the displayed automaton itself).
+    *limits* are the keyword arguments of the construction's ``Budget``;
+    above *dot_max_states* states only a summary of the graph is rendered.
+    With *integers* the variables range over ℤ instead of ℕ.  *subformulas*
+    are automata of subformulas to reuse, as selected by
+    ``SubformulaCache.reusable``; those built now are returned in
+    ``"subformulas"``.
+    """
+    from presburger_converter.automaton.budget import Budget
+    from presburger_converter.automaton.mata_io import nfa_to_bytes, nfa_to_mata
+    from presburger_converter.automaton.store import AutomatonStore
+    from presburger_converter.pipeline import formula_to_aut
+    from presburger_converter.profiling import ConstructionTrace, stage
+    from presburger_converter.solutions import find_example_solutions
+    from presburger_converter.viz import aut_to_dot
+
+    trace = ConstructionTrace() if profile else None
+    store = AutomatonStore(store_dir, store_max_bytes) if store_dir else None
+    budget = Budget(**limits) if limits else None
+    cache = _subformula_cache(subformulas)
+    aut_min, aut, variables = formula_to_aut(
+        formula, display_atomic_construction, trace=trace, store=store, budget=budget,
+        integers=integers, subformulas=cache,
+    )
+    with stage(trace, "solutions"):
+        solutions = find_example_solutions(aut_min, k_solutions, variables, integers=integers)
+    with stage(trace, "render_dot"):
+        dot = aut_to_dot(aut, variables, display_labels=display_labels,
+                         display_atomic_construction=display_atomic_construction,
+                         max_states=dot_max_states)
+    with stage(trace, "mata_export"):
+        mata = nfa_to_mata(aut)
+    return {
+        "aut": nfa_to_bytes(aut, compress_labels=True, width=len(variables)),
+        "aut_min": None if aut_min is aut else
+                   nfa_to_bytes(aut_min, compress_labels=True, width=len(variables)),
+        "variables": variables,
+        "dot": dot,
+        "mata": mata,
+        "example_solutions": solutions,
+        "num_states": len(aut.get_reachable_states()),
+        "num_final_states": len(aut.final_states),
+        "trace": trace,
+        "subformulas": cache.serialized(skip=subformulas) if cache is not None else {},
+    }
+
+
+def build_job(
+    formula: str,
+    display_atomic_construction: bool = False,
+    store_dir: Optional[str] = None,
+    store_max_bytes: int = 256 * 2**20,
+    limits: Optional[Dict[str, Any]] = None,
+    integers: bool = False,
+    subformulas: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Compile *formula* and return only its automata in the binary format.
+
+    *subformulas* are handled as by :func:`compile_job`.
+    """
+    from presburger_converter.automaton.budget import Budget
+    from presburger_converter.automaton.mata_io import nfa_to_bytes
+    from presburger_converter.automaton.store import AutomatonStore
+    from presburger_converter.pipeline import formula_to_aut
+
+    store = AutomatonStore(store_dir, store_max_bytes) if store_dir else None
+    budget = Budget(**limits) if limits else None
+    cache = _subformula_cache(subformulas)
+    aut_min, aut, variables = formula_to_aut(
+        formula, display_atomic_construction, store=store, budget=budget,
+        integers=integers, subformulas=cache,
+    )
+    return {
+        "aut": nfa_to_bytes(aut, compress_labels=True, width=len(variables)),
+        "aut_min": None if aut_min is aut else
+                   nfa_to_bytes(aut_min, compress_labels=True, width=len(variables)),
+        "variables": variables,
+        "subformulas": cache.serialized(skip=subformulas) if cache is not None else {},
+    }
+
+
+def solutions_job(aut: bytes, k_solutions: int, variables: List[str],
+                  integers: bool = False) -> List[Dict[str, Any]]:
+    """Return the first *k_solutions* example solutions of an automaton."""
+    from presburger_converter.automaton.mata_io import nfa_from_bytes
+    from presburger_converter.solutions import find_example_solutions
+
+    return find_example_solutions(nfa_from_bytes(aut), k_solutions, variables,
+                                  integers=integers)
+
+
+def dot_job(aut: bytes, variables: List[str], display_labels: bool = True,
+            display_atomic_construction: bool = False,
+            max_states: Optional[int] = None) -> str:
+    """Render an automaton as DOT (a summary above *max_states* states)."""
+    from presburger_converter.automaton.mata_io import nfa_from_bytes
+    from presburger_converter.viz import aut_to_dot
+
+    return aut_to_dot(nfa_from_bytes(aut), variables, display_labels=display_labels,
+                      display_atomic_construction=display_atomic_construction,
+                      max_states=max_states)